@@ -0,0 +1,273 @@
+"""
+Adapters Module
+Handles LoRA style adapters on a loaded pipeline: in-memory caching, hot-swapping and fusing
+"""
+
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import torch
+from diffusers.utils import USE_PEFT_BACKEND
+
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("adapters")
+
+ADAPTER_EXTENSIONS = (".safetensors", ".bin", ".pt")
+
+# One manager per pipeline object, however many generators use it
+_managers = weakref.WeakKeyDictionary()
+_manager_ids = itertools.count(1)
+
+
+def normalize_adapters(adapters):
+    """
+    Canonical form of an adapter request
+
+    Args:
+        adapters: None, a name, a list of names, or a dict {name: weight}
+
+    Returns:
+        Tuple of (name, weight) pairs sorted by name; () means no adapter
+    """
+    if not adapters:
+        return ()
+    if isinstance(adapters, str):
+        adapters = {adapters: 1.0}
+    elif not isinstance(adapters, dict):
+        adapters = {name: 1.0 for name in adapters}
+    return tuple(sorted((name, float(weight)) for name, weight in adapters.items()))
+
+
+def load_adapter_file(path):
+    """Read LoRA weights from a local file onto the CPU"""
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+    return torch.load(path, map_location="cpu")
+
+
+class AdapterManager:
+    """
+    Swap LoRA adapters on a loaded pipeline per request
+
+    Adapter files are registered by name. Their weights are kept in a CPU LRU
+    (max_cached) so a swap never rereads the disk, and up to max_attached
+    adapters stay injected in the pipeline; switching between attached
+    adapters only changes which are active. Requesting the same adapters
+    fuse_hot_after times in a row fuses them into the base weights, so they
+    cost nothing per step; the next different request unfuses first.
+
+    Every request must go through activate() (None detaches all LoRA
+    effects), which also keeps pipelines that share a text encoder or UNet
+    through a ModelRegistry consistent.
+    """
+
+    def __init__(self, pipe, max_cached=16, max_attached=4, fuse_hot_after=None, fuse_allowed=None):
+        """
+        Initialize the manager (use for_pipeline to get the pipeline's shared one)
+
+        Args:
+            pipe: Loaded diffusers pipeline (LoRA support needs the peft package)
+            max_cached: Adapter state dicts kept in CPU memory
+            max_attached: Adapters kept injected in the pipeline
+            fuse_hot_after: Consecutive identical requests before fusing (None = never fuse)
+            fuse_allowed: Callable returning False when fusing must be avoided
+                          (e.g. components shared with another resident pipeline)
+        """
+        self.pipe = pipe
+        self.max_cached = max_cached
+        self.max_attached = max_attached
+        self.fuse_hot_after = fuse_hot_after
+        self.fuse_allowed = fuse_allowed or (lambda: True)
+
+        self._lock = threading.RLock()
+        self._paths = {}
+        self._cached = OrderedDict()
+        self._attached = OrderedDict()
+        # Injected adapter names are unique per manager: pipelines sharing a
+        # text encoder would otherwise collide on the same name
+        self._prefix = f"m{next(_manager_ids)}_"
+        self.active = ()
+        self.fused = ()
+        self._streak = 0
+        self.stats = {"requests": 0, "disk_loads": 0, "attaches": 0, "evictions": 0, "fuses": 0}
+
+    @classmethod
+    def for_pipeline(cls, pipe, **kwargs):
+        """The manager of a pipeline, created on first use (kwargs apply then only)"""
+        manager = _managers.get(pipe)
+        if manager is None:
+            manager = _managers[pipe] = cls(pipe, **kwargs)
+        return manager
+
+    def register(self, name, path):
+        """Make a local LoRA file available under a name"""
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Adapter file not found: {path}")
+        with self._lock:
+            if self._paths.get(name) not in (None, path):
+                # Re-registered with another file: forget the old weights
+                self._unfuse()
+                self._cached.pop(name, None)
+                self._detach(name)
+            self._paths[name] = path
+
+    def register_directory(self, directory):
+        """
+        Register every adapter file in a directory under its file name
+
+        Returns:
+            List of registered names
+        """
+        names = []
+        if not os.path.isdir(directory):
+            return names
+        for filename in sorted(os.listdir(directory)):
+            stem, extension = os.path.splitext(filename)
+            if extension in ADAPTER_EXTENSIONS:
+                self.register(stem, os.path.join(directory, filename))
+                names.append(stem)
+        return names
+
+    def available(self):
+        """Registered adapter names"""
+        with self._lock:
+            return sorted(self._paths)
+
+    def _state_dict(self, name):
+        """Adapter weights from the CPU cache, reading the file on a miss (lock held)"""
+        if name in self._cached:
+            self._cached.move_to_end(name)
+            return self._cached[name]
+        if name not in self._paths:
+            raise KeyError(f"Unknown adapter '{name}'. Registered: {', '.join(sorted(self._paths)) or 'none'}")
+
+        start = time.perf_counter()
+        state_dict = load_adapter_file(self._paths[name])
+        self._cached[name] = state_dict
+        while len(self._cached) > self.max_cached:
+            self._cached.popitem(last=False)
+        self.stats["disk_loads"] += 1
+        log_event(
+            logger, "adapter.read", level=logging.DEBUG,
+            adapter=name,
+            tensors=len(state_dict),
+            duration_s=round(time.perf_counter() - start, 3)
+        )
+        return state_dict
+
+    def _attach(self, name, keep=()):
+        """Inject an adapter into the pipeline, evicting idle ones over max_attached (lock held)"""
+        if name in self._attached:
+            self._attached.move_to_end(name)
+            return self._attached[name]
+
+        # Least recently used first; adapters needed by this request stay
+        idle = [n for n in self._attached if n not in keep]
+        while idle and len(self._attached) >= self.max_attached:
+            self._detach(idle.pop(0))
+            self.stats["evictions"] += 1
+
+        start = time.perf_counter()
+        adapter_name = self._prefix + re.sub(r"\W", "_", name)
+        # load_lora_weights consumes the dict it is given; the cached one stays intact
+        self.pipe.load_lora_weights(dict(self._state_dict(name)), adapter_name=adapter_name)
+        self._attached[name] = adapter_name
+        self.stats["attaches"] += 1
+        log_event(
+            logger, "adapter.attach", level=logging.DEBUG,
+            adapter=name,
+            attached=len(self._attached),
+            duration_s=round(time.perf_counter() - start, 3)
+        )
+        return adapter_name
+
+    def _detach(self, name):
+        """Remove an injected adapter (lock held)"""
+        adapter_name = self._attached.pop(name, None)
+        if adapter_name is not None:
+            self.pipe.delete_adapters(adapter_name)
+
+    def _unfuse(self):
+        """Restore the base weights (lock held)"""
+        if self.fused:
+            self.pipe.unfuse_lora()
+            log_event(logger, "adapter.unfuse", level=logging.DEBUG, adapters=[name for name, _ in self.fused])
+            self.fused = ()
+
+    def _has_lora_layers(self):
+        """
+        Whether any component may carry LoRA layers (possibly injected by
+        another pipeline's manager through a shared component)
+
+        Without the PEFT backend no adapter can have been attached, and
+        get_list_adapters() would raise, so plain generation never asks it.
+        """
+        if not USE_PEFT_BACKEND:
+            return False
+        if not any(manager._attached or manager.fused for manager in list(_managers.values())):
+            return False
+        return any(self.pipe.get_list_adapters().values())
+
+    def activate(self, adapters=None):
+        """
+        Make exactly the requested adapters affect the next pipeline call
+
+        Args:
+            adapters: None, a name, a list of names, or a dict {name: weight}
+
+        Returns:
+            Normalized adapter tuple (see normalize_adapters)
+        """
+        spec = normalize_adapters(adapters)
+        with self._lock:
+            self.stats["requests"] += 1
+            self._streak = self._streak + 1 if spec == self.active else 1
+            if spec and spec == self.fused:
+                return spec
+
+            start = time.perf_counter()
+            self._unfuse()
+            if not spec:
+                if self._has_lora_layers():
+                    self.pipe.disable_lora()
+            else:
+                if not USE_PEFT_BACKEND:
+                    raise RuntimeError("LoRA adapters need the PEFT backend: install peft and transformers from requirements.txt")
+                names = [name for name, _ in spec]
+                adapter_names = [self._attach(name, keep=names) for name in names]
+                self.pipe.enable_lora()
+                self.pipe.set_adapters(adapter_names, adapter_weights=[weight for _, weight in spec])
+
+                if self.fuse_hot_after and self._streak >= self.fuse_hot_after and self.fuse_allowed():
+                    self.pipe.fuse_lora(adapter_names=adapter_names)
+                    self.fused = spec
+                    self.stats["fuses"] += 1
+                    log_event(logger, "adapter.fuse", adapters=names, streak=self._streak)
+
+            if spec != self.active:
+                log_event(
+                    logger, "adapter.switch", level=logging.DEBUG,
+                    adapters=[name for name, _ in spec],
+                    duration_s=round(time.perf_counter() - start, 4)
+                )
+            self.active = spec
+        return spec
+
+    def clear(self):
+        """Detach everything and drop the CPU cache"""
+        with self._lock:
+            self._unfuse()
+            for name in list(self._attached):
+                self._detach(name)
+            self._cached.clear()
+            self.active = ()
+            self._streak = 0
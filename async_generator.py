@@ -0,0 +1,208 @@
+"""
+Async Generator Module
+Handles an asyncio facade over ImageGenerator with cancellation and backpressure
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_generator import GenerationInterrupted
+from schedulers import resolve_settings
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("async")
+
+
+class AsyncImageGenerator:
+    """
+    Await ImageGenerator calls from asyncio code
+
+    Pipeline calls run one at a time on a dedicated executor thread; file I/O
+    runs on a separate small pool so saving overlaps the next generation.
+    Cancelling the awaiting task stops the pipeline at the next denoising
+    step. At most max_pending requests may be queued or running; further
+    callers wait for a slot (or get asyncio.QueueFull with wait=False).
+    """
+
+    def __init__(self, generator, max_pending=8, io_workers=4):
+        """
+        Initialize the facade
+
+        Args:
+            generator: Loaded ImageGenerator (only the pipeline thread touches it)
+            max_pending: Requests admitted before callers are held back
+            io_workers: Threads for save/load offloading
+        """
+        self.generator = generator
+        self.max_pending = max_pending
+        self._pipeline = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="image-io")
+        # Created on first use so it binds to the running loop (Python 3.8/3.9)
+        self._slots = None
+        self._in_flight = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self, wait=True):
+        """Shut down both executors"""
+        self._pipeline.shutdown(wait=wait)
+        self._io.shutdown(wait=wait)
+
+    @property
+    def pending(self):
+        """Requests currently queued or running"""
+        return self._in_flight
+
+    async def _acquire(self, wait):
+        """Take a request slot, waiting for one unless wait=False"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if not wait and self._slots.locked():
+            raise asyncio.QueueFull(f"{self.max_pending} generation request(s) already pending")
+        await self._slots.acquire()
+        self._in_flight += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    async def _run_pipeline(self, cancel_event, on_step=None, **kwargs):
+        """
+        Run generate_images on the pipeline thread
+
+        Returns:
+            (images, generation params) captured on the pipeline thread
+        """
+        def step_callback(step_index, timestep, latents):
+            if cancel_event.is_set():
+                raise GenerationInterrupted()
+            if on_step is not None:
+                on_step(step_index, timestep)
+
+        def call():
+            if cancel_event.is_set():
+                raise GenerationInterrupted()
+            images = self.generator.generate_images(step_callback=step_callback, **kwargs)
+            return images, dict(self.generator.last_generation_params)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pipeline, call)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Stop the running call at its next step; a queued one never starts
+            cancel_event.set()
+            log_event(logger, "async.cancelled", level=logging.DEBUG)
+            raise
+
+    async def generate(self, prompt, wait=True, **kwargs):
+        """
+        Generate images (same arguments as ImageGenerator.generate_images)
+
+        Args:
+            prompt: Text prompt
+            wait: Wait for a free slot when max_pending requests are in flight;
+                  False raises asyncio.QueueFull instead
+            **kwargs: generate_images arguments
+
+        Returns:
+            List of PIL Images
+        """
+        images, _ = await self.generate_with_params(prompt, wait=wait, **kwargs)
+        return images
+
+    async def generate_with_params(self, prompt, wait=True, **kwargs):
+        """
+        Like generate(), also returning this call's own generation parameters
+
+        Returns:
+            (list of PIL Images, params dict for save_images)
+        """
+        await self._acquire(wait)
+        try:
+            return await self._run_pipeline(threading.Event(), prompt=prompt, **kwargs)
+        finally:
+            self._release()
+
+    async def stream(self, prompt, wait=True, **kwargs):
+        """
+        Generate images while yielding progress events
+
+        Yields dicts {'type': 'step', 'step', 'total', 'timestep'} after every
+        denoising step, then {'type': 'done', 'images', 'params'}. Leaving the
+        async for early (or cancelling the task) stops the pipeline.
+
+        Args:
+            prompt: Text prompt
+            wait: See generate()
+            **kwargs: generate_images arguments
+        """
+        _, total = resolve_settings(kwargs.get("preset"), kwargs.get("scheduler"), kwargs.get("num_inference_steps"))
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        cancel_event = threading.Event()
+
+        def on_step(step_index, timestep):
+            event = {"type": "step", "step": step_index + 1, "total": total, "timestep": int(timestep)}
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        await self._acquire(wait)
+        task = loop.create_task(self._run_pipeline(cancel_event, on_step=on_step, prompt=prompt, **kwargs))
+        try:
+            while True:
+                getter = loop.create_task(events.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                # Drain steps that arrived together with completion
+                while not events.empty():
+                    yield events.get_nowait()
+                images, params = task.result()
+                yield {"type": "done", "images": images, "params": params}
+                return
+        finally:
+            if not task.done():
+                cancel_event.set()
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, GenerationInterrupted):
+                    pass
+            self._release()
+
+    async def run_io(self, func, *args, **kwargs):
+        """Run a blocking file operation on the I/O pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, functools.partial(func, *args, **kwargs))
+
+    async def save_images(self, images, prompt, generation_params, **kwargs):
+        """
+        ImageGenerator.save_images (encoding, writes, metadata DB) on the I/O pool
+
+        generation_params is required: take it from generate_with_params() or
+        the stream's 'done' event. Concurrent requests share the generator, so
+        its last_generation_params may already belong to another call.
+        """
+        return await self.run_io(
+            self.generator.save_images, images, prompt, generation_params=generation_params, **kwargs
+        )
+
+    async def load_image(self, path):
+        """Open and decode an image file on the I/O pool"""
+        def load():
+            with Image.open(path) as image:
+                image.load()
+                return image.copy()
+        return await self.run_io(load)
@@ -1,139 +1,428 @@
-"""
-Batch Image Generation Script
-Generate multiple images from a list of prompts
-"""
-
-from image_generator import ImageGenerator
-import json
-import os
-from datetime import datetime
-
-def batch_generate(prompts_file="prompts.json", output_dir="batch_output"):
-    """
-    Generate images from a JSON file containing prompts
-    
-    prompts.json format:
-    {
-        "prompts": [
-            {
-                "text": "A beautiful sunset over mountains",
-                "style": "realistic",
-                "num_images": 2,
-                "negative_prompt": "blurry, distorted"
-            },
-            ...
-        ]
-    }
-    """
-    
-    # Load prompts
-    print("Loading prompts...")
-    with open(prompts_file, 'r') as f:
-        data = json.load(f)
-    
-    prompts = data.get('prompts', [])
-    print(f"Found {len(prompts)} prompts to process")
-    
-    # Initialize generator
-    print("\nInitializing image generator...")
-    generator = ImageGenerator()
-    
-    # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Process each prompt
-    results = []
-    
-    for idx, prompt_config in enumerate(prompts, 1):
-        print(f"\n{'='*60}")
-        print(f"Processing prompt {idx}/{len(prompts)}")
-        print(f"{'='*60}")
-        
-        text = prompt_config.get('text', '')
-        style = prompt_config.get('style', 'realistic')
-        num_images = prompt_config.get('num_images', 1)
-        negative_prompt = prompt_config.get('negative_prompt', '')
-        
-        print(f"Prompt: {text}")
-        print(f"Style: {style}")
-        print(f"Number of images: {num_images}")
-        
-        try:
-            # Generate images
-            images = generator.generate_images(
-                prompt=text,
-                negative_prompt=negative_prompt,
-                num_images=num_images,
-                style=style
-            )
-            
-            # Save images
-            saved_paths = generator.save_images(
-                images,
-                text,
-                output_dir=output_dir
-            )
-            
-            results.append({
-                "prompt": text,
-                "status": "success",
-                "num_generated": len(images),
-                "paths": saved_paths
-            })
-            
-            print(f"✅ Successfully generated {len(images)} image(s)")
-            
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            results.append({
-                "prompt": text,
-                "status": "failed",
-                "error": str(e)
-            })
-    
-    # Save batch results
-    results_file = os.path.join(output_dir, f"batch_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-    with open(results_file, 'w') as f:
-        json.dump(results, f, indent=2)
-    
-    print(f"\n{'='*60}")
-    print("BATCH GENERATION COMPLETE")
-    print(f"{'='*60}")
-    print(f"Total prompts: {len(prompts)}")
-    print(f"Successful: {sum(1 for r in results if r['status'] == 'success')}")
-    print(f"Failed: {sum(1 for r in results if r['status'] == 'failed')}")
-    print(f"Results saved to: {results_file}")
-
-if __name__ == "__main__":
-    # Example: Create a sample prompts file if it doesn't exist
-    if not os.path.exists("prompts.json"):
-        sample_prompts = {
-            "prompts": [
-                {
-                    "text": "A serene mountain lake at sunrise, professional photography",
-                    "style": "realistic",
-                    "num_images": 1,
-                    "negative_prompt": "blurry, distorted"
-                },
-                {
-                    "text": "Abstract representation of artificial intelligence, vibrant colors",
-                    "style": "artistic",
-                    "num_images": 1,
-                    "negative_prompt": "ugly, low quality"
-                },
-                {
-                    "text": "Cyberpunk city street at night with neon lights",
-                    "style": "cyberpunk",
-                    "num_images": 1,
-                    "negative_prompt": "blurry, low resolution"
-                }
-            ]
-        }
-        
-        with open("prompts.json", 'w') as f:
-            json.dump(sample_prompts, f, indent=2)
-        
-        print("Created sample prompts.json file")
-    
-    # Run batch generation
+"""
+Batch Image Generation Script
+Generate multiple images from a list of prompts
+"""
+
+from adapters import normalize_adapters
+from generation_scheduler import DeviceLock
+from image_generator import ImageGenerator
+from profiling import GenerationProfiler
+from prompt_utils import PromptVariator, normalize_prompt
+from structured_logging import get_logger, job_context, log_event
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+logger = get_logger("batch")
+
+
+# Keys of a template entry that control expansion (everything else is copied to each job)
+TEMPLATE_KEYS = ("template", "axes", "sample", "sample_seed", "limit")
+
+
+def _axis_values(value):
+    """
+    Resolve one template axis
+    
+    Args:
+        value: List of strings, or the name of a PromptVariator list
+               ('LIGHTING_MODIFIERS', 'COMPOSITION_MODIFIERS', 'MOOD_MODIFIERS',
+               'QUALITY_TAGS') or style list ('STYLE_MODIFIERS.fantasy')
+    
+    Returns:
+        List of strings
+    """
+    if not isinstance(value, str):
+        return list(value)
+    
+    name, _, key = value.partition(".")
+    pool = getattr(PromptVariator, name, None)
+    if key and isinstance(pool, dict):
+        pool = pool.get(key)
+    if not isinstance(pool, list):
+        raise ValueError(f"Unknown template axis '{value}'")
+    return list(pool)
+
+
+def fill_axes(pattern, fields):
+    """
+    Substitute {axis} placeholders, leaving every other brace as written
+    
+    Args:
+        pattern: Text that may contain placeholders (e.g. a negative prompt)
+        fields: Axis name -> value for this combination
+    
+    Returns:
+        Pattern with the declared axes filled in
+    """
+    return re.sub(r"\{(\w+)\}", lambda m: str(fields.get(m.group(1), m.group(0))), pattern)
+
+
+def expand_template(entry):
+    """
+    Lazily expand a template entry into plain prompt entries
+    
+    The cartesian product of the axes is never materialized: combinations are
+    generated one at a time, or, with "sample", drawn as flat indices and
+    decoded per axis.
+    
+    Args:
+        entry: Dict with "template" (str.format pattern), "axes" (name -> values),
+               optional "sample" (random combinations to draw), "sample_seed",
+               "limit" (maximum jobs) and any regular entry keys. The negative
+               prompt may use the same placeholders; any other braces in it
+               are kept literally.
+    
+    Yields:
+        Plain entry dicts with "text" filled in
+    """
+    names = list(entry.get('axes', {}))
+    values = [_axis_values(entry['axes'][name]) for name in names]
+    sizes = [len(v) for v in values]
+    total = math.prod(sizes)
+    
+    sample = entry.get('sample')
+    if sample is not None and sample < total:
+        rng = np.random.default_rng(entry.get('sample_seed'))
+        flat = np.sort(rng.choice(total, size=int(sample), replace=False))
+        # Mixed-radix decode: last axis varies fastest, as in itertools.product
+        digits = np.stack(np.unravel_index(flat, sizes), axis=1) if sizes else np.zeros((len(flat), 0), int)
+        combos = (tuple(v[d] for v, d in zip(values, row)) for row in digits)
+    else:
+        combos = itertools.product(*values)
+    
+    if entry.get('limit') is not None:
+        combos = itertools.islice(combos, int(entry['limit']))
+    
+    base = {key: value for key, value in entry.items() if key not in TEMPLATE_KEYS}
+    for combo in combos:
+        fields = dict(zip(names, combo))
+        job = dict(base)
+        job['text'] = entry['template'].format(**fields)
+        if base.get('negative_prompt'):
+            job['negative_prompt'] = fill_axes(base['negative_prompt'], fields)
+        yield job
+
+
+def iter_entries(prompts):
+    """Yield plain prompt entries, expanding template entries lazily"""
+    for entry in prompts:
+        if 'template' in entry:
+            yield from expand_template(entry)
+        else:
+            yield entry
+
+
+def plan_jobs(prompts, default_preset=None, dedupe=True, order=True):
+    """
+    Normalize batch entries and merge the ones that describe the same job
+    
+    Entries whose normalized prompt, negative prompt, style and sampling
+    settings match are generated once with the largest requested image
+    count; every entry then receives the first `num_images` of those images.
+    
+    Args:
+        prompts: Iterable of plain entries (e.g. iter_entries of a prompts.json
+                 "prompts" list); consumed once and not kept, but every planned
+                 job is held in memory to merge and sort them
+        default_preset: Preset for entries that don't set one
+        dedupe: Merge identical jobs (False keeps one job per entry)
+        order: Sort jobs so those sharing a LoRA adapter run back to back (one
+               switch per group), then those sharing a negative prompt and
+               settings (the negative embedding is encoded once per group,
+               as encode_text caches by exact text), then by prompt text
+        
+    Returns:
+        List of job dicts; job["entries"] holds (entry index, num_images) pairs
+    """
+    jobs = {}
+    for idx, prompt_config in enumerate(prompts):
+        seeds = prompt_config.get('seeds')
+        num_images = len(seeds) if seeds else prompt_config.get('num_images', 1)
+        job = {
+            'text': normalize_prompt(prompt_config.get('text', '')),
+            'negative_prompt': normalize_prompt(prompt_config.get('negative_prompt', '')),
+            'style': prompt_config.get('style', 'realistic'),
+            'preset': prompt_config.get('preset', default_preset),
+            'scheduler': prompt_config.get('scheduler'),
+            'num_inference_steps': prompt_config.get('num_inference_steps'),
+            'seed': prompt_config.get('seed'),
+            'seeds': list(seeds) if seeds else None,
+            'adapter': dict(normalize_adapters(prompt_config.get('adapter'))) or None,
+        }
+        key = json.dumps(job, sort_keys=True) if dedupe else idx
+        
+        if key not in jobs:
+            job['num_images'] = num_images
+            job['entries'] = []
+            jobs[key] = job
+        jobs[key]['num_images'] = max(jobs[key]['num_images'], num_images)
+        jobs[key]['entries'].append((idx, num_images))
+    
+    jobs = list(jobs.values())
+    if order:
+        jobs.sort(key=lambda job: (
+            json.dumps(job['adapter'], sort_keys=True),
+            job['negative_prompt'],
+            job['style'],
+            str(job['preset']),
+            str(job['scheduler']),
+            str(job['num_inference_steps']),
+            job['text']
+        ))
+    return jobs
+
+
+def batch_generate(
+    prompts_file="prompts.json",
+    output_dir="batch_output",
+    profile=None,
+    profile_sample_every=None,
+    image_format=None,
+    generator=None,
+    scheduler=None,
+    user="batch"
+):
+    """
+    Generate images from a JSON file containing prompts
+    
+    Args:
+        prompts_file: Path to the prompts JSON file
+        output_dir: Directory for images, results and profiles
+        profile: Enable profiling; None reads IMAGE_GEN_PROFILE from the environment
+        profile_sample_every: Profile 1 in N prompts; None reads IMAGE_GEN_PROFILE_SAMPLE
+        image_format: Encoding preset for saved images; None uses the file's
+                      "image_format" key (default 'png')
+        generator: Loaded ImageGenerator to reuse (None loads the default model)
+        scheduler: GenerationScheduler shared with interactive callers; jobs are then
+                   submitted at 'batch' priority and yield to interactive requests.
+                   Without one (e.g. run as a separate process), each job takes
+                   the host-wide DeviceLock, alternating with the app job by job
+        user: Identity used by the scheduler for fairness and limits
+    
+    prompts.json format:
+    {
+        "image_format": "webp",   (optional, see image_encoding.ENCODING_PRESETS)
+        "encode_options": {"quality": 85},   (optional)
+        "naming": "uuid",   (optional: "uuid", "hash" or "timestamp")
+        "shard": false,   (optional: nest outputs as ab/cd/<name>)
+        "preset": "balanced",   (optional: "fast", "balanced" or "quality"; entries may override)
+        "dedupe": true,   (optional: generate identical normalized entries once, see plan_jobs)
+        "long_prompts": "truncate",   (optional: "chunk" encodes prompts over 75 tokens in windows)
+        "order": true,   (optional: group jobs by negative prompt/settings and prompt prefix)
+        "prompts": [
+            {
+                "template": "{subject}, {lighting}, {composition}",   (template entry)
+                "axes": {
+                    "subject": ["a red fox", "an old lighthouse"],
+                    "lighting": "LIGHTING_MODIFIERS",   (a PromptVariator list)
+                    "composition": "COMPOSITION_MODIFIERS"
+                },
+                "sample": 40,   (optional: random combinations instead of all of them)
+                "sample_seed": 0,   (optional)
+                "limit": 100,   (optional: cap on expanded jobs)
+                "style": "realistic"   (plus any regular entry key)
+            },
+            {
+                "text": "A beautiful sunset over mountains",
+                "style": "realistic",
+                "num_images": 2,
+                "negative_prompt": "blurry, distorted",
+                "preset": "fast",   (optional)
+                "scheduler": "unipc",   (optional, see schedulers.SCHEDULERS)
+                "num_inference_steps": 20,   (optional)
+                "seed": 1234,   (optional: image k uses seed + k; or "seeds": [..] per image)
+                "adapter": "watercolor"   (optional: LoRA adapter name, or {"name": weight, ...})
+            },
+            ...
+        ]
+    }
+    """
+    
+    # Load prompts
+    log_event(logger, "batch.load", prompts_file=prompts_file)
+    with open(prompts_file, 'r') as f:
+        data = json.load(f)
+    
+    # Template expansions (already cut to their "limit") are fed lazily into
+    # plan_jobs, which holds every planned job; of the entries only texts are kept
+    entry_texts = []
+    def track(entries):
+        for entry in entries:
+            entry_texts.append(entry.get('text', ''))
+            yield entry
+    
+    image_format = image_format or data.get('image_format', 'png')
+    encode_options = data.get('encode_options')
+    naming = data.get('naming', 'uuid')
+    shard = data.get('shard', False)
+    default_preset = data.get('preset')
+    long_prompts = data.get('long_prompts', 'truncate')
+    jobs = plan_jobs(
+        track(iter_entries(data.get('prompts', []))),
+        default_preset,
+        dedupe=data.get('dedupe', True),
+        order=data.get('order', True)
+    )
+    log_event(logger, "batch.loaded", num_prompts=len(entry_texts), num_jobs=len(jobs))
+    
+    # Initialize generator
+    if generator is None:
+        profiler = GenerationProfiler(
+            enabled=profile,
+            sample_every=profile_sample_every,
+            output_dir=output_dir
+        )
+        generator = ImageGenerator(profiler=profiler)
+    
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+    device_lock = DeviceLock() if scheduler is None else None
+    
+    # Process each unique job, then fan its images out to the entries that requested it
+    results = [None] * len(entry_texts)
+    batch_start = time.perf_counter()
+    
+    for idx, job in enumerate(jobs, 1):
+        text = job['text']
+        num_images = job['num_images']
+        
+        with job_context() as job_id:
+            log_event(
+                logger, "job.start", level=logging.DEBUG,
+                index=idx,
+                total=len(jobs),
+                prompt=text,
+                style=job['style'],
+                num_images=num_images,
+                num_entries=len(job['entries'])
+            )
+            job_start = time.perf_counter()
+            
+            try:
+                # Generate images
+                job_kwargs = dict(
+                    prompt=text,
+                    negative_prompt=job['negative_prompt'],
+                    num_images=num_images,
+                    style=job['style'],
+                    num_inference_steps=job['num_inference_steps'],
+                    scheduler=job['scheduler'],
+                    preset=job['preset'],
+                    seed=job['seed'],
+                    seeds=job['seeds'],
+                    long_prompts=long_prompts,
+                    adapter=job['adapter']
+                )
+                if scheduler is not None:
+                    # The ticket carries this job's own parameters; by the time it
+                    # resolves the worker may already be running another user's job
+                    ticket = scheduler.submit(generator, user=user, priority="batch", **job_kwargs)
+                    images = ticket.result()
+                    generation_params = ticket.params
+                else:
+                    with device_lock:
+                        images = generator.generate_images(**job_kwargs)
+                        generation_params = dict(generator.last_generation_params)
+                generate_s = time.perf_counter() - job_start
+                seeds = generation_params["seeds"]
+                
+                # Save images
+                saved_paths = generator.save_images(
+                    images,
+                    text,
+                    output_dir=output_dir,
+                    image_format=image_format,
+                    encode_options=encode_options,
+                    naming=naming,
+                    shard=shard,
+                    generation_params=generation_params
+                )
+                
+                for entry_idx, entry_images in job['entries']:
+                    results[entry_idx] = {
+                        "job_id": job_id,
+                        "prompt": entry_texts[entry_idx],
+                        "status": "success",
+                        "num_generated": entry_images,
+                        "seeds": seeds[:entry_images],
+                        "paths": saved_paths[:entry_images]
+                    }
+                
+                log_event(
+                    logger, "job.done",
+                    index=idx,
+                    total=len(jobs),
+                    num_images=len(images),
+                    num_entries=len(job['entries']),
+                    generate_s=round(generate_s, 3),
+                    total_s=round(time.perf_counter() - job_start, 3)
+                )
+                
+            except Exception as e:
+                log_event(logger, "job.failed", level=logging.ERROR, index=idx, error=str(e))
+                for entry_idx, _ in job['entries']:
+                    results[entry_idx] = {
+                        "job_id": job_id,
+                        "prompt": entry_texts[entry_idx],
+                        "status": "failed",
+                        "error": str(e)
+                    }
+    
+    # Save batch results
+    results_file = os.path.join(output_dir, f"batch_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    
+    log_event(
+        logger, "batch.done",
+        total=len(entry_texts),
+        unique_jobs=len(jobs),
+        successful=sum(1 for r in results if r['status'] == 'success'),
+        failed=sum(1 for r in results if r['status'] == 'failed'),
+        num_images=sum(r.get('num_generated', 0) for r in results),
+        duration_s=round(time.perf_counter() - batch_start, 3),
+        results_file=results_file
+    )
+
+if __name__ == "__main__":
+    # Example: Create a sample prompts file if it doesn't exist
+    if not os.path.exists("prompts.json"):
+        sample_prompts = {
+            "prompts": [
+                {
+                    "text": "A serene mountain lake at sunrise, professional photography",
+                    "style": "realistic",
+                    "num_images": 1,
+                    "negative_prompt": "blurry, distorted"
+                },
+                {
+                    "text": "Abstract representation of artificial intelligence, vibrant colors",
+                    "style": "artistic",
+                    "num_images": 1,
+                    "negative_prompt": "ugly, low quality"
+                },
+                {
+                    "text": "Cyberpunk city street at night with neon lights",
+                    "style": "cyberpunk",
+                    "num_images": 1,
+                    "negative_prompt": "blurry, low resolution"
+                }
+            ]
+        }
+        
+        with open("prompts.json", 'w') as f:
+            json.dump(sample_prompts, f, indent=2)
+        
+        log_event(logger, "batch.sample_created", path="prompts.json")
+    
+    # Run batch generation
     batch_generate()
\ No newline at end of file
@@ -0,0 +1,380 @@
+"""
+Cost Model Module
+Handles generation time estimates calibrated from measured runs, and admission control
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from output_paths import atomic_write_bytes
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("cost")
+
+DEFAULT_COST_MODEL_PATH = os.path.join("generated_images", "cost_model.json")
+
+# Seconds per denoising step and per decode for one 512x512 image before any
+# run has been measured (fp16 on a mid-range GPU vs. fp32 on a desktop CPU)
+PRIOR_STEP_S = {"cuda": 0.06, "mps": 0.4, "cpu": 2.0}
+PRIOR_DECODE_S = {"cuda": 0.1, "mps": 0.6, "cpu": 3.0}
+
+ADMISSION_ACTIONS = ("accept", "downgrade", "queue", "reject")
+
+
+def _work(width, height, num_images):
+    """Work units: images x pixels, in 512x512-image equivalents"""
+    return num_images * (width * height) / (512 * 512)
+
+
+class CostModel:
+    """
+    Estimate generate_images wall time as  a * steps * work + b * work + c
+
+    work is num_images x megapixels (in 512x512 units). a, b and c are fitted
+    by least squares per (model, device) from recent measured runs; a
+    per-(model, device, size, batch) correction factor absorbs what the
+    linear model misses (attention cost grows faster than pixel count).
+    Before three runs are measured, device priors are used.
+    """
+
+    def __init__(self, path=None, max_observations=200, smoothing=0.3, save_interval_s=60.0):
+        """
+        Initialize the model
+
+        Args:
+            path: JSON file the observations are persisted to; defaults to
+                  $IMAGE_GEN_COST_MODEL or generated_images/cost_model.json
+                  (empty string disables persistence)
+            max_observations: Runs kept per (model, device)
+            smoothing: Weight of the newest run in the per-shape correction
+            save_interval_s: Minimum seconds between writes of the JSON file;
+                             anything newer is written by flush() or at exit
+        """
+        self.path = path if path is not None else os.environ.get("IMAGE_GEN_COST_MODEL", DEFAULT_COST_MODEL_PATH)
+        self.max_observations = max_observations
+        self.smoothing = smoothing
+        self.save_interval_s = save_interval_s
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._observations = defaultdict(lambda: deque(maxlen=self.max_observations))
+        self._corrections = {}
+        self._coefficients = {}
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _device_key(device):
+        return str(device).split(":")[0]
+
+    def _load(self):
+        """Read persisted observations, if any"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, rows in data.get("observations", {}).items():
+            model_id, device = key.rsplit("|", 1)
+            self._observations[(model_id, device)].extend(tuple(row) for row in rows)
+        for key, factor in data.get("corrections", {}).items():
+            self._corrections[tuple(json.loads(key))] = factor
+
+    def _save(self):
+        """Persist observations (lock held)"""
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        data = {
+            "observations": {f"{m}|{d}": list(rows) for (m, d), rows in self._observations.items()},
+            "corrections": {json.dumps(list(key)): factor for key, factor in self._corrections.items()},
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write_bytes(self.path, json.dumps(data).encode())
+
+    def flush(self):
+        """Write observations not yet persisted"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _fit(self, model_id, device):
+        """Least-squares coefficients (a, b, c) for a (model, device), or None (lock held)"""
+        key = (model_id, device)
+        if key in self._coefficients:
+            return self._coefficients[key]
+
+        rows = self._observations.get(key)
+        coefficients = None
+        if rows and len(rows) >= 3:
+            data = np.array(rows, dtype=float)
+            steps, work, duration = data[:, 0], data[:, 1], data[:, 2]
+            features = np.stack([steps * work, work, np.ones_like(work)], axis=1)
+            solution, _, rank, _ = np.linalg.lstsq(features, duration, rcond=None)
+            if rank == 3:
+                coefficients = tuple(max(0.0, float(v)) for v in solution)
+            else:
+                # Too little variety for three terms: per-step cost only
+                coefficients = (float(np.sum(duration) / np.sum(steps * work)), 0.0, 0.0)
+
+        self._coefficients[key] = coefficients
+        return coefficients
+
+    def _base_estimate(self, model_id, device, width, height, num_images, steps):
+        """Estimate before the per-shape correction (lock held)"""
+        work = _work(width, height, num_images)
+        coefficients = self._fit(model_id, device)
+        if coefficients is None:
+            step_s = PRIOR_STEP_S.get(device, PRIOR_STEP_S["cpu"])
+            decode_s = PRIOR_DECODE_S.get(device, PRIOR_DECODE_S["cpu"])
+            return steps * work * step_s + work * decode_s
+        a, b, c = coefficients
+        return a * steps * work + b * work + c
+
+    def estimate(self, model_id, device, width, height, num_images, steps):
+        """
+        Estimated generate_images wall time
+
+        Args:
+            model_id: Model identifier
+            device: 'cuda', 'cpu', ...
+            width, height: Image size
+            num_images: Images per call
+            steps: Denoising steps
+
+        Returns:
+            Seconds
+        """
+        device = self._device_key(device)
+        with self._lock:
+            base = self._base_estimate(model_id, device, width, height, num_images, steps)
+            factor = self._corrections.get((model_id, device, width, height, num_images), 1.0)
+        return base * factor
+
+    def observe(self, model_id, device, width, height, num_images, steps, duration_s):
+        """
+        Record a measured run
+
+        Args:
+            model_id, device, width, height, num_images, steps: As in estimate()
+            duration_s: Measured wall time of the call
+        """
+        device = self._device_key(device)
+        shape = (model_id, device, width, height, num_images)
+        with self._lock:
+            predicted = self._base_estimate(model_id, device, width, height, num_images, steps)
+            predicted *= self._corrections.get(shape, 1.0)
+            self._observations[(model_id, device)].append((steps, _work(width, height, num_images), duration_s))
+            self._coefficients.pop((model_id, device), None)
+
+            # Corrections are relative to the fitted model, never to the priors
+            base = self._base_estimate(model_id, device, width, height, num_images, steps)
+            if self._fit(model_id, device) is not None and base > 0:
+                ratio = duration_s / base
+                previous = self._corrections.get(shape)
+                self._corrections[shape] = ratio if previous is None else (
+                    (1 - self.smoothing) * previous + self.smoothing * ratio
+                )
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self.save_interval_s:
+                self._save()
+
+        log_event(
+            logger, "cost.observe", level=logging.DEBUG,
+            model=model_id,
+            device=device,
+            size=f"{width}x{height}",
+            num_images=num_images,
+            steps=steps,
+            duration_s=round(duration_s, 3),
+            predicted_s=round(predicted, 3)
+        )
+
+
+class AdmissionDecision:
+    """Outcome of AdmissionController.admit"""
+
+    def __init__(self, action, user, width, height, num_images, steps, estimate_s, eta_s, reason=""):
+        self.action = action
+        self.user = user
+        self.width = width
+        self.height = height
+        self.num_images = num_images
+        self.steps = steps
+        self.estimate_s = estimate_s
+        self.eta_s = eta_s
+        self.reason = reason
+
+    @property
+    def admitted(self):
+        """Whether the request (possibly downgraded or queued) may run"""
+        return self.action != "reject"
+
+    @property
+    def priority(self):
+        """
+        GenerationScheduler priority to submit at: queued requests run at
+        'batch' priority, after (and preempted by) everyone's interactive work
+        """
+        return "batch" if self.action == "queue" else "interactive"
+
+    def __repr__(self):
+        return (
+            f"AdmissionDecision({self.action}, {self.num_images}x{self.width}x{self.height}, "
+            f"{self.steps} steps, ~{self.estimate_s:.0f}s, eta {self.eta_s:.0f}s)"
+        )
+
+
+class AdmissionController:
+    """
+    Keep each request and each user within a time budget
+
+    Requests estimated to run longer than max_request_s are downgraded (fewer
+    steps, then fewer images, then a smaller size) or rejected when even the
+    smallest variant is too slow. Requests that fit but would push the user's
+    outstanding work over max_user_s are queued: submitted at
+    decision.priority, they wait until no interactive work is pending. ETAs
+    include all admitted work that hasn't finished yet.
+    """
+
+    def __init__(
+        self,
+        cost_model,
+        max_request_s=None,
+        max_user_s=None,
+        allow_downgrade=True,
+        min_steps=15,
+        min_size=384
+    ):
+        """
+        Initialize the controller
+
+        Args:
+            cost_model: CostModel used for estimates
+            max_request_s: Budget per request; None reads IMAGE_GEN_MAX_REQUEST_S (default 300)
+            max_user_s: Budget of outstanding work per user; None reads IMAGE_GEN_MAX_USER_S (default 900)
+            allow_downgrade: Downgrade over-budget requests instead of rejecting them
+            min_steps: Fewest steps a downgrade may use
+            min_size: Smallest side a downgrade may shrink to
+        """
+        self.cost_model = cost_model
+        self.max_request_s = float(max_request_s or os.environ.get("IMAGE_GEN_MAX_REQUEST_S", 300))
+        self.max_user_s = float(max_user_s or os.environ.get("IMAGE_GEN_MAX_USER_S", 900))
+        self.allow_downgrade = allow_downgrade
+        self.min_steps = min_steps
+        self.min_size = min_size
+
+        self._lock = threading.Lock()
+        self._outstanding = defaultdict(float)
+
+    def outstanding(self, user=None):
+        """Estimated seconds of admitted, unfinished work (for one user or everyone)"""
+        with self._lock:
+            if user is not None:
+                return self._outstanding.get(user, 0.0)
+            return sum(self._outstanding.values())
+
+    def _downgrades(self, width, height, num_images, steps):
+        """Cheaper variants in order of preference: steps, then images, then size"""
+        while steps > self.min_steps:
+            steps = max(self.min_steps, int(steps * 0.75))
+            yield width, height, num_images, steps
+        while num_images > 1:
+            num_images -= 1
+            yield width, height, num_images, steps
+        while min(width, height) > self.min_size:
+            scale = max(self.min_size / min(width, height), 0.75)
+            width = max(64, int(width * scale) // 64 * 64)
+            height = max(64, int(height * scale) // 64 * 64)
+            yield width, height, num_images, steps
+
+    def admit(self, user, model_id, device, width, height, num_images, steps, allow_downgrade=None):
+        """
+        Decide whether and how a request may run
+
+        Args:
+            user: Identity the per-user budget applies to (the account or client,
+                  not a per-session ID, or a user escapes it by opening tabs)
+            model_id, device: Where it will run
+            width, height, num_images, steps: Requested settings
+            allow_downgrade: Override the controller's setting; False for work whose
+                             settings can't change (e.g. refining an existing image)
+
+        Returns:
+            AdmissionDecision (settings may be downgraded; call reserve() before running)
+        """
+        def estimate(w, h, n, s):
+            return self.cost_model.estimate(model_id, device, w, h, n, s)
+
+        requested = (width, height, num_images, steps)
+        estimate_s = estimate(*requested)
+        action, reason = "accept", ""
+
+        if estimate_s > self.max_request_s:
+            action, reason = "reject", (
+                f"Estimated {estimate_s:.0f}s exceeds the {self.max_request_s:.0f}s per-request budget"
+            )
+            if self.allow_downgrade if allow_downgrade is None else allow_downgrade:
+                for variant in self._downgrades(*requested):
+                    variant_s = estimate(*variant)
+                    if variant_s <= self.max_request_s:
+                        width, height, num_images, steps = variant
+                        action = "downgrade"
+                        reason += f"; reduced to {num_images}x{width}x{height} at {steps} steps (~{variant_s:.0f}s)"
+                        estimate_s = variant_s
+                        break
+
+        user_outstanding = self.outstanding(user)
+        if action != "reject" and user_outstanding + estimate_s > self.max_user_s:
+            action = "queue"
+            reason = (reason + "; " if reason else "") + (
+                f"{user_outstanding:.0f}s of your earlier work is still running"
+            )
+
+        decision = AdmissionDecision(
+            action, user, width, height, num_images, steps,
+            estimate_s=estimate_s,
+            eta_s=self.outstanding() + estimate_s,
+            reason=reason
+        )
+        log_event(
+            logger, "admission.decision", level=logging.DEBUG if action == "accept" else logging.INFO,
+            user=user,
+            action=action,
+            requested=f"{requested[2]}x{requested[0]}x{requested[1]}@{requested[3]}",
+            granted=f"{num_images}x{width}x{height}@{steps}",
+            estimate_s=round(estimate_s, 1),
+            eta_s=round(decision.eta_s, 1)
+        )
+        return decision
+
+    @contextmanager
+    def reserve(self, decision):
+        """Count an admitted request against its user's budget while it runs"""
+        if not decision.admitted:
+            raise ValueError(f"Request was rejected: {decision.reason}")
+        with self._lock:
+            self._outstanding[decision.user] += decision.estimate_s
+        try:
+            yield decision
+        finally:
+            with self._lock:
+                self._outstanding[decision.user] -= decision.estimate_s
+                if self._outstanding[decision.user] <= 1e-9:
+                    del self._outstanding[decision.user]
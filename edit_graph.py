@@ -0,0 +1,194 @@
+"""
+Edit Graph Module
+Handles lazily evaluated, cached edit chains for the image editor
+"""
+
+import threading
+from collections import OrderedDict
+
+from image_encoding import ImageEncoder
+from image_processor import ImageProcessor
+
+
+# Operation name -> function(image, **params) returning a new image
+OPERATIONS = {
+    "upscale": lambda image, scale_factor, method: ImageProcessor.upscale_image(image, scale_factor, method),
+    "brightness": lambda image, factor: ImageProcessor.apply_brightness(image, factor),
+    "contrast": lambda image, factor: ImageProcessor.apply_contrast(image, factor),
+    "saturation": lambda image, factor: ImageProcessor.apply_saturation(image, factor),
+    "sharpness": lambda image, factor: ImageProcessor.apply_sharpness(image, factor),
+    "filter": lambda image, name: ImageProcessor.apply_filter(image, name),
+    "crop": lambda image, box: ImageProcessor.crop_image(image, *box),
+    "resize": lambda image, width, height, maintain_aspect: ImageProcessor.resize_image(
+        image, width, height, maintain_aspect
+    ),
+    "remove_watermark": lambda image, watermark: ImageProcessor.remove_watermark(image, watermark=watermark),
+}
+
+
+class EditCache:
+    """Small LRU cache of rendered edit results and their encoded bytes"""
+
+    def __init__(self, max_entries=24):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for a key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class EditGraph:
+    """
+    Immutable chain of edits on a source image
+
+    Adding an operation only records it; pixels are computed by render() (or
+    to_bytes()) and cached per (source, operation chain). The source image is
+    never copied or modified, and identity edits (factor 1.0, full-frame crop,
+    same-size resize) are dropped from the chain.
+    """
+
+    def __init__(self, source, source_key=None, cache=None, ops=()):
+        """
+        Initialize the graph
+
+        Args:
+            source: PIL Image the chain starts from (treated as read-only)
+            source_key: Hashable identity of the source (e.g. its file path);
+                        defaults to the object's id
+            cache: Shared EditCache; None creates a private one
+            ops: Recorded (name, params) operations
+        """
+        self.source = source
+        self.source_key = source_key if source_key is not None else id(source)
+        self.cache = cache if cache is not None else EditCache()
+        self.ops = tuple(ops)
+
+    @property
+    def key(self):
+        """Cache key of this chain"""
+        return (self.source_key, self.ops)
+
+    def then(self, name, **params):
+        """
+        Record an operation
+
+        Args:
+            name: Key of OPERATIONS
+            **params: Operation parameters (must be hashable)
+
+        Returns:
+            New EditGraph; this one is unchanged
+        """
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown edit '{name}'. Choose from: {', '.join(OPERATIONS)}")
+        op = (name, tuple(sorted(params.items())))
+        return EditGraph(self.source, self.source_key, self.cache, self.ops + (op,))
+
+    def upscale(self, scale_factor=2, method='lanczos'):
+        """Record an upscale"""
+        return self.then("upscale", scale_factor=scale_factor, method=method)
+
+    def adjust(self, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+        """Record enhancement factors; factors of 1.0 are skipped"""
+        graph = self
+        for name, factor in (
+            ("brightness", brightness),
+            ("contrast", contrast),
+            ("saturation", saturation),
+            ("sharpness", sharpness),
+        ):
+            if factor != 1.0:
+                graph = graph.then(name, factor=factor)
+        return graph
+
+    def filter(self, name):
+        """Record a named ImageProcessor.apply_filter filter"""
+        return self.then("filter", name=name)
+
+    def crop(self, left, top, right, bottom):
+        """Record a crop; a full-frame crop of the source is skipped"""
+        box = (int(left), int(top), int(right), int(bottom))
+        if not self.ops and box == (0, 0) + tuple(self.source.size):
+            return self
+        return self.then("crop", box=box)
+
+    def resize(self, width, height, maintain_aspect=True):
+        """Record a resize; resizing the source to its own size is skipped"""
+        if not self.ops and (int(width), int(height)) == tuple(self.source.size):
+            return self
+        return self.then("resize", width=int(width), height=int(height), maintain_aspect=maintain_aspect)
+
+    def remove_watermark(self, watermark=None):
+        """Record a watermark removal (see ImageProcessor.remove_watermark)"""
+        return self.then("remove_watermark", watermark=watermark)
+
+    def render(self):
+        """
+        Materialize the chain
+
+        The longest already-rendered prefix of the chain is reused, so
+        extending an edit only computes the new operations.
+
+        Returns:
+            PIL Image (the source itself for an empty chain; do not modify it)
+        """
+        image, start = self.source, 0
+        for end in range(len(self.ops), 0, -1):
+            cached = self.cache.get(("image", self.source_key, self.ops[:end]))
+            if cached is not None:
+                image, start = cached, end
+                break
+
+        if start == len(self.ops):
+            return image
+
+        for name, params in self.ops[start:]:
+            image = OPERATIONS[name](image, **dict(params))
+        self.cache.put(("image",) + self.key, image)
+        return image
+
+    def to_bytes(self, preset="png", **encode_options):
+        """
+        Encode the rendered result in memory (for downloads)
+
+        Args:
+            preset: Key of image_encoding.ENCODING_PRESETS
+            **encode_options: Overrides for the preset's save options
+
+        Returns:
+            Encoded bytes, cached alongside the rendered image
+        """
+        key = ("bytes",) + self.key + (preset, tuple(sorted(encode_options.items())))
+        data = self.cache.get(key)
+        if data is None:
+            data = ImageEncoder(preset, **encode_options).encode(self.render())
+            self.cache.put(key, data)
+        return data
@@ -0,0 +1,473 @@
+"""
+Generation Scheduler Module
+Handles priority scheduling of interactive and batch generation sharing one GPU
+"""
+
+import itertools
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future
+
+from image_generator import GenerationInterrupted, ImageGenerator
+from structured_logging import get_logger, log_event
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+logger = get_logger("scheduler")
+
+# Lower value runs first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+DEFAULT_DEVICE_LOCK_PATH = os.path.join(tempfile.gettempdir(), "image_generator_device.lock")
+
+
+class UserLimitExceeded(RuntimeError):
+    """A user already has the maximum number of pending requests"""
+
+
+def _lock_file(fd):
+    """Block until this process holds an exclusive lock on an open file"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class DeviceLock:
+    """
+    Exclusive use of the GPU across processes on this host
+
+    An OS file lock held for the duration of each pipeline call. The app's
+    scheduler and a batch_generator run in another process take it in turn,
+    so their calls never overlap on the device; the kernel releases it if a
+    process dies. Waiting is first come, first served: priorities and step
+    preemption only apply within one process's scheduler.
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the lock
+
+        Args:
+            path: Lock file; None reads IMAGE_GEN_DEVICE_LOCK (default in the
+                  temp directory, one per host). Use one file per GPU when
+                  processes run on different GPUs; an empty string disables it.
+        """
+        self.path = path if path is not None else os.environ.get("IMAGE_GEN_DEVICE_LOCK", DEFAULT_DEVICE_LOCK_PATH)
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if not self.path:
+            return
+        start = time.perf_counter()
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                _lock_file(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._lock.release()
+            raise
+        self._fd = fd
+        waited = time.perf_counter() - start
+        if waited > 0.1:
+            log_event(logger, "scheduler.device_wait", level=logging.DEBUG, path=self.path, wait_s=round(waited, 3))
+
+    def release(self):
+        if self._fd is not None:
+            try:
+                _unlock_file(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class GenerationTicket(Future):
+    """Future for one scheduled request; resolves to the list of PIL Images"""
+
+    def __init__(self, request_id, user, priority):
+        super().__init__()
+        self.request_id = request_id
+        self.user = user
+        self.priority = priority
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.preemptions = 0
+        # Merged generation parameters of the whole request (all seeds)
+        self.params = None
+
+
+class _Request:
+    """Queued request, split into micro-batches of seeds"""
+
+    def __init__(self, ticket, generator, kwargs, seeds, micro_batch_size, func=None):
+        self.ticket = ticket
+        self.generator = generator
+        self.kwargs = kwargs
+        self.seeds = seeds
+        self.chunks = deque(seeds[i:i + micro_batch_size] for i in range(0, len(seeds), micro_batch_size))
+        self.images = []
+        self.generate_s = 0.0
+        # Arbitrary pipeline work (img2img, drafts, ...) run once as a single chunk
+        self.func = func
+
+
+class GenerationScheduler:
+    """
+    Serialize generate_images calls on one worker thread, highest priority first
+
+    Interactive requests run as a single pipeline call. Batch requests are
+    split into micro-batches of seeds (per-image seeds make the split
+    invisible in the output), and the queue is re-checked between them. With
+    step_preemption, a running batch micro-batch is abandoned between
+    denoising steps as soon as interactive work arrives and is retried later.
+    Within a priority class, users take turns one micro-batch at a time.
+
+    The queue lives in this process. Other processes on the host (e.g. a
+    batch_generator run from the command line) are arbitrated only through
+    the DeviceLock held around every pipeline call: they take turns with
+    this worker call by call, without priorities or preemption.
+    """
+
+    def __init__(
+        self,
+        max_pending_per_user=4,
+        batch_micro_batch_size=1,
+        step_preemption=True,
+        latency_window=1000,
+        device_lock=None
+    ):
+        """
+        Initialize the scheduler
+
+        Args:
+            max_pending_per_user: Requests a user may have queued or running at once
+            batch_micro_batch_size: Images per pipeline call for batch requests
+            step_preemption: Abandon batch micro-batches mid-denoising for interactive work
+            latency_window: Completed requests per priority kept for latency stats
+            device_lock: DeviceLock shared with other processes; None uses the host-wide default
+        """
+        self.max_pending_per_user = max_pending_per_user
+        self.batch_micro_batch_size = batch_micro_batch_size
+        self.step_preemption = step_preemption
+        self.device_lock = device_lock if device_lock is not None else DeviceLock()
+
+        self._cond = threading.Condition()
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._pending = Counter()
+        self._latencies = {priority: deque(maxlen=latency_window) for priority in PRIORITIES}
+        self._ids = itertools.count(1)
+        self._worker = None
+        self._stopping = False
+
+    @staticmethod
+    def _check_priority(priority):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Choose from: {', '.join(PRIORITIES)}")
+
+    def _enqueue(self, request):
+        """Queue a request, enforcing the per-user limit"""
+        ticket = request.ticket
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Scheduler is shut down")
+            if self._pending[ticket.user] >= self.max_pending_per_user:
+                raise UserLimitExceeded(
+                    f"User '{ticket.user}' already has {self._pending[ticket.user]} pending request(s) "
+                    f"(limit {self.max_pending_per_user})"
+                )
+            self._queues[ticket.priority].setdefault(ticket.user, deque()).append(request)
+            self._pending[ticket.user] += 1
+            self._ensure_worker()
+            self._cond.notify()
+
+    def submit(self, generator, user="default", priority="interactive", **kwargs):
+        """
+        Queue a generate_images call
+
+        Args:
+            generator: ImageGenerator to run on
+            user: Identity used for fairness and the per-user limit
+            priority: 'interactive' or 'batch'
+            **kwargs: generate_images arguments (num_images, seed and seeds are
+                      resolved here so micro-batches reproduce the full request)
+
+        Returns:
+            GenerationTicket
+        """
+        self._check_priority(priority)
+        kwargs = dict(kwargs)
+        seeds = ImageGenerator.make_seeds(kwargs.pop("num_images", 1), kwargs.pop("seed", None), kwargs.pop("seeds", None))
+        micro_batch_size = len(seeds) if priority == "interactive" else max(1, self.batch_micro_batch_size)
+
+        ticket = GenerationTicket(next(self._ids), user, priority)
+        request = _Request(ticket, generator, kwargs, seeds, micro_batch_size)
+        self._enqueue(request)
+
+        log_event(
+            logger, "scheduler.submit", level=logging.DEBUG,
+            request_id=ticket.request_id,
+            user=user,
+            priority=priority,
+            num_images=len(seeds),
+            micro_batches=len(request.chunks)
+        )
+        return ticket
+
+    def generate(self, generator, user="default", priority="interactive", timeout=None, **kwargs):
+        """Submit and wait; returns the images like generate_images"""
+        return self.submit(generator, user=user, priority=priority, **kwargs).result(timeout)
+
+    def submit_call(self, func, *args, user="default", priority="interactive", **kwargs):
+        """
+        Queue any other pipeline work (img2img, drafts, variations, ...)
+
+        Runs func(*args, **kwargs) on the worker thread, so it never overlaps
+        a generation on a pipeline (scheduler swaps, adapter switches) that
+        other sessions share. It is not split or preempted.
+
+        Returns:
+            GenerationTicket resolving to func's return value
+        """
+        self._check_priority(priority)
+        ticket = GenerationTicket(next(self._ids), user, priority)
+        request = _Request(ticket, None, kwargs, [None], 1, func=lambda: func(*args, **kwargs))
+        self._enqueue(request)
+
+        log_event(
+            logger, "scheduler.submit", level=logging.DEBUG,
+            request_id=ticket.request_id,
+            user=user,
+            priority=priority,
+            call=getattr(func, "__name__", "call")
+        )
+        return ticket
+
+    def call(self, func, *args, user="default", priority="interactive", timeout=None, **kwargs):
+        """Submit pipeline work with submit_call and wait for its result"""
+        return self.submit_call(func, *args, user=user, priority=priority, **kwargs).result(timeout)
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use (called with the lock held)"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+            self._worker.start()
+
+    def _next_request(self):
+        """Head request of the next user in the highest non-empty class (lock held)"""
+        for priority in sorted(PRIORITIES, key=PRIORITIES.get):
+            users = self._queues[priority]
+            if users:
+                user = next(iter(users))
+                # Round-robin: the user goes to the back after each micro-batch
+                users.move_to_end(user)
+                return users[user][0]
+        return None
+
+    def _finish(self, request):
+        """Remove a finished request from its queue (lock held)"""
+        ticket = request.ticket
+        users = self._queues[ticket.priority]
+        queue = users.get(ticket.user)
+        if queue and queue[0] is request:
+            queue.popleft()
+            if not queue:
+                del users[ticket.user]
+        self._pending[ticket.user] -= 1
+        if self._pending[ticket.user] <= 0:
+            del self._pending[ticket.user]
+
+    def _higher_priority_waiting(self, priority):
+        """Whether any request of a more urgent class is queued"""
+        with self._cond:
+            return any(
+                self._queues[other]
+                for other, rank in PRIORITIES.items()
+                if rank < PRIORITIES[priority]
+            )
+
+    def _run(self):
+        """Worker loop: one micro-batch per iteration"""
+        while True:
+            with self._cond:
+                request = self._next_request()
+                while request is None and not self._stopping:
+                    self._cond.wait()
+                    request = self._next_request()
+                if request is None:
+                    return
+
+                ticket = request.ticket
+                if ticket.started_at is None:
+                    if not ticket.set_running_or_notify_cancel():
+                        self._finish(request)
+                        continue
+                    ticket.started_at = time.perf_counter()
+
+            self._run_micro_batch(request)
+
+    def _run_call(self, request):
+        """Run a submit_call request and resolve its ticket"""
+        ticket = request.ticket
+        try:
+            with self.device_lock:
+                result = request.func()
+        except Exception as e:
+            with self._cond:
+                self._finish(request)
+            ticket.set_exception(e)
+            log_event(logger, "scheduler.failed", level=logging.ERROR, request_id=ticket.request_id, error=str(e))
+            return
+
+        latency = time.perf_counter() - ticket.submitted_at
+        with self._cond:
+            self._finish(request)
+            self._latencies[ticket.priority].append(latency)
+        ticket.set_result(result)
+
+    def _run_micro_batch(self, request):
+        """Run the next micro-batch of a request and resolve its ticket when done"""
+        if request.func is not None:
+            self._run_call(request)
+            return
+
+        ticket = request.ticket
+        chunk = request.chunks[0]
+
+        step_callback = None
+        if self.step_preemption and PRIORITIES[ticket.priority] > min(PRIORITIES.values()):
+            def step_callback(step_index, timestep, latents):
+                if self._higher_priority_waiting(ticket.priority):
+                    raise GenerationInterrupted()
+
+        start = time.perf_counter()
+        try:
+            with self.device_lock:
+                images = request.generator.generate_images(
+                    **request.kwargs,
+                    num_images=len(chunk),
+                    seeds=chunk,
+                    step_callback=step_callback
+                )
+        except GenerationInterrupted:
+            # The chunk stays queued and is retried from scratch
+            ticket.preemptions += 1
+            log_event(
+                logger, "scheduler.preempted", level=logging.DEBUG,
+                request_id=ticket.request_id,
+                user=ticket.user,
+                wasted_s=round(time.perf_counter() - start, 3)
+            )
+            return
+        except Exception as e:
+            with self._cond:
+                self._finish(request)
+            ticket.set_exception(e)
+            log_event(logger, "scheduler.failed", level=logging.ERROR, request_id=ticket.request_id, error=str(e))
+            return
+
+        request.images.extend(images)
+        request.generate_s += time.perf_counter() - start
+        request.chunks.popleft()
+        if request.chunks:
+            return
+
+        # Whole request done: record parameters covering every seed
+        params = dict(request.generator.last_generation_params or {})
+        params.update({
+            "seed": request.seeds[0],
+            "seeds": request.seeds,
+            "num_images": len(request.seeds),
+            "generate_s": round(request.generate_s, 3),
+        })
+        request.generator.last_generation_params = params
+        ticket.params = params
+
+        latency = time.perf_counter() - ticket.submitted_at
+        with self._cond:
+            self._finish(request)
+            self._latencies[ticket.priority].append(latency)
+        ticket.set_result(request.images)
+
+        log_event(
+            logger, "scheduler.done",
+            request_id=ticket.request_id,
+            user=ticket.user,
+            priority=ticket.priority,
+            num_images=len(request.images),
+            wait_s=round(ticket.started_at - ticket.submitted_at, 3),
+            latency_s=round(latency, 3),
+            preemptions=ticket.preemptions
+        )
+
+    def queue_depth(self, priority=None):
+        """Number of queued or running requests (optionally of one priority)"""
+        with self._cond:
+            priorities = [priority] if priority else list(PRIORITIES)
+            return sum(len(queue) for p in priorities for queue in self._queues[p].values())
+
+    def stats(self):
+        """
+        Queue depth and end-to-end latency percentiles per priority
+
+        Returns:
+            Dict priority -> {'queued', 'completed', 'p50_s', 'p95_s'}
+        """
+        stats = {}
+        with self._cond:
+            for priority in PRIORITIES:
+                latencies = sorted(self._latencies[priority])
+                def percentile(q):
+                    if not latencies:
+                        return None
+                    return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+                stats[priority] = {
+                    "queued": sum(len(queue) for queue in self._queues[priority].values()),
+                    "completed": len(latencies),
+                    "p50_s": percentile(0.50),
+                    "p95_s": percentile(0.95),
+                }
+        return stats
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; the worker exits once the queues are drained"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            worker = self._worker
+        if wait and worker is not None:
+            worker.join()
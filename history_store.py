@@ -0,0 +1,397 @@
+"""
+History Store Module
+Handles persistent generation history and favorites, and a bounded image cache for the UI
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from PIL import Image
+
+
+DEFAULT_DB_PATH = os.path.join("generated_images", "history.db")
+
+# History fields promoted to columns; everything else is kept in the params JSON
+HISTORY_COLUMNS = [
+    "prompt", "negative_prompt", "style", "num_steps", "scheduler",
+    "guidance_scale", "width", "height", "created_at",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT,
+    negative_prompt TEXT,
+    style TEXT,
+    num_steps INTEGER,
+    scheduler TEXT,
+    guidance_scale REAL,
+    width INTEGER,
+    height INTEGER,
+    created_at TEXT,
+    params TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_style ON history (style);
+"""
+
+# Tables of per-owner image paths, keyed on (owner, path) so two owners'
+# records of the same path never replace each other; '' is no owner
+PATH_TABLES = {
+    "history_images": """
+CREATE TABLE IF NOT EXISTS {table} (
+    owner TEXT NOT NULL DEFAULT '',
+    path TEXT NOT NULL,
+    history_id INTEGER NOT NULL REFERENCES history (id) ON DELETE CASCADE,
+    position INTEGER,
+    PRIMARY KEY (owner, path)
+);
+""",
+    "favorites": """
+CREATE TABLE IF NOT EXISTS {table} (
+    owner TEXT NOT NULL DEFAULT '',
+    path TEXT NOT NULL,
+    prompt TEXT,
+    created_at TEXT,
+    params TEXT,
+    PRIMARY KEY (owner, path)
+);
+""",
+}
+
+# Rows of the path-keyed tables from before per-owner scoping, in the
+# column order of PATH_TABLES (history images take their entry's owner)
+PATH_TABLE_MIGRATIONS = {
+    "history_images": (
+        "SELECT IFNULL(history.owner, ''), history_images.path, history_images.history_id, history_images.position "
+        "FROM history_images JOIN history ON history.id = history_images.history_id"
+    ),
+    "favorites": "SELECT IFNULL(owner, ''), path, prompt, created_at, params FROM favorites",
+}
+
+# Created after databases from before per-owner scoping are migrated
+OWNER_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_history_owner ON history (owner, id);
+CREATE INDEX IF NOT EXISTS idx_history_images_entry ON history_images (history_id);
+CREATE INDEX IF NOT EXISTS idx_favorites_owner ON favorites (owner, created_at);
+"""
+
+
+class HistoryStore:
+    """
+    SQLite-backed generation history and favorites, indexed by owner and image path
+
+    Every record belongs to an owner. A store opened without one sees and
+    clears everything; for_owner() returns a view on the same connection
+    that only reads, writes and clears one owner's records.
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Open (or create) the store
+
+        Args:
+            db_path: Database file; defaults to $IMAGE_GEN_HISTORY_DB or
+                     generated_images/history.db
+        """
+        self.owner = None
+        self.db_path = db_path or os.environ.get("IMAGE_GEN_HISTORY_DB") or DEFAULT_DB_PATH
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Streamlit reruns the script on different threads
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA + "".join(
+            schema.format(table=table) for table, schema in PATH_TABLES.items()
+        ))
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(history)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE history ADD COLUMN owner TEXT")
+        self._migrate_path_tables()
+        self._conn.executescript(OWNER_INDEXES)
+
+    def _migrate_path_tables(self):
+        """Rebuild path tables keyed on path alone (older databases) keyed on (owner, path)"""
+        for table, schema in PATH_TABLES.items():
+            key = [row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})") if row["pk"]]
+            if key != ["path"]:
+                continue
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if "owner" not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN owner TEXT")
+            # One transaction, so an interrupted migration leaves the old table in place
+            self._conn.executescript(
+                "BEGIN;"
+                + schema.format(table=f"{table}_migrated")
+                + f"INSERT INTO {table}_migrated {PATH_TABLE_MIGRATIONS[table]};"
+                + f"DROP TABLE {table};"
+                + f"ALTER TABLE {table}_migrated RENAME TO {table};"
+                + "COMMIT;"
+            )
+
+    def for_owner(self, owner):
+        """View of the store limited to one owner's records (shares the connection)"""
+        view = copy.copy(self)
+        view.owner = owner
+        return view
+
+    def _where(self, *conditions):
+        """WHERE clause and arguments for (sql, args) conditions plus the owner scope"""
+        conditions = [condition for condition in conditions if condition]
+        if self.owner is not None:
+            conditions.append(("owner = ?", [self.owner]))
+        if not conditions:
+            return "", []
+        return " WHERE " + " AND ".join(sql for sql, _ in conditions), [arg for _, args in conditions for arg in args]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _entry(row, paths):
+        """Rebuild a history item dict (the shape app.py used to keep in session_state)"""
+        item = json.loads(row["params"]) if row["params"] else {}
+        item.update({column: row[column] for column in HISTORY_COLUMNS})
+        item["id"] = row["id"]
+        item["timestamp"] = row["created_at"]
+        item["images"] = paths
+        return item
+
+    def _paths(self, entry_ids):
+        """Image paths per history ID, in saved order"""
+        if not entry_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in entry_ids)
+        rows = self._conn.execute(
+            f"SELECT history_id, path FROM history_images WHERE history_id IN ({placeholders}) "
+            "ORDER BY history_id, position",
+            list(entry_ids)
+        ).fetchall()
+        paths = {entry_id: [] for entry_id in entry_ids}
+        for row in rows:
+            paths[row["history_id"]].append(row["path"])
+        return paths
+
+    def add_entry(self, item):
+        """
+        Record one generation
+
+        Args:
+            item: Dict with 'images' (saved paths), 'prompt' and any other settings;
+                  HISTORY_COLUMNS are stored as columns, the rest as JSON
+
+        Returns:
+            History ID
+        """
+        item = dict(item)
+        paths = list(item.pop("images", []))
+        item.setdefault("created_at", item.pop("timestamp", None) or datetime.now().isoformat())
+        values = [item.get(column) for column in HISTORY_COLUMNS]
+        extra = {key: value for key, value in item.items() if key not in HISTORY_COLUMNS}
+
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}, params, owner) "
+                f"VALUES ({', '.join('?' for _ in range(len(HISTORY_COLUMNS) + 2))})",
+                values + [json.dumps(extra, default=str), self.owner]
+            )
+            entry_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO history_images (owner, path, history_id, position) VALUES (?, ?, ?, ?)",
+                [(self.owner or "", path, entry_id, position) for position, path in enumerate(paths)]
+            )
+        return entry_id
+
+    def get_entry(self, entry_id):
+        """History item by ID, or None (also for another owner's item)"""
+        where, args = self._where(("id = ?", [entry_id]))
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM history" + where, args).fetchone()
+            if row is None:
+                return None
+            return self._entry(row, self._paths([entry_id])[entry_id])
+
+    def entry_for_path(self, path):
+        """History item that produced an image path, or None (indexed lookup)"""
+        where, args = self._where(("path = ?", [path]))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history_id FROM history_images" + where + " ORDER BY history_id DESC LIMIT 1", args
+            ).fetchone()
+        return self.get_entry(row["history_id"]) if row else None
+
+    def recent(self, limit=None, offset=0, style=None, newest_first=True):
+        """
+        List history items
+
+        Args:
+            limit: Maximum items (None = all)
+            offset: Items to skip (for paging)
+            style: Only items with this style
+            newest_first: Sort order
+
+        Returns:
+            List of history item dicts
+        """
+        where, args = self._where(("style = ?", [style]) if style else None)
+        sql = "SELECT * FROM history" + where
+        sql += " ORDER BY id " + ("DESC" if newest_first else "ASC")
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            args.extend([int(limit), int(offset)])
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+            paths = self._paths([row["id"] for row in rows])
+        return [self._entry(row, paths[row["id"]]) for row in rows]
+
+    def count(self, style=None):
+        """Number of history items"""
+        where, args = self._where(("style = ?", [style]) if style else None)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history" + where, args).fetchone()[0]
+
+    def styles(self):
+        """Distinct styles in the history"""
+        where, args = self._where(("style IS NOT NULL", []))
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT style FROM history" + where, args).fetchall()
+        return sorted(row["style"] for row in rows)
+
+    def clear_history(self):
+        """Delete every history item of the owner (favorites are kept)"""
+        where, args = self._where()
+        with self._lock, self._conn:
+            # history_images rows go with their entries (ON DELETE CASCADE)
+            self._conn.execute("DELETE FROM history" + where, args)
+
+    def is_favorite(self, path):
+        """Whether an image path is a favorite (indexed lookup)"""
+        where, args = self._where(("path = ?", [path]))
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM favorites" + where, args).fetchone() is not None
+
+    def favorite_paths(self):
+        """Set of favorite paths (one query for a whole page of images)"""
+        where, args = self._where()
+        with self._lock:
+            return {row["path"] for row in self._conn.execute("SELECT path FROM favorites" + where, args)}
+
+    def add_favorite(self, path, prompt="", metadata=None):
+        """Mark an image as favorite"""
+        params = {key: value for key, value in (metadata or {}).items() if key not in ("path", "prompt")}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO favorites (owner, path, prompt, created_at, params) VALUES (?, ?, ?, ?, ?)",
+                (self.owner or "", path, prompt, datetime.now().isoformat(), json.dumps(params, default=str))
+            )
+
+    def remove_favorite(self, path):
+        """Unmark an image as favorite"""
+        where, args = self._where(("path = ?", [path]))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM favorites" + where, args)
+
+    def toggle_favorite(self, path, prompt="", metadata=None):
+        """
+        Flip an image's favorite state
+
+        Returns:
+            True if the image is now a favorite
+        """
+        if self.is_favorite(path):
+            self.remove_favorite(path)
+            return False
+        self.add_favorite(path, prompt, metadata)
+        return True
+
+    def favorites(self):
+        """List favorites, oldest first"""
+        where, args = self._where()
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM favorites" + where + " ORDER BY created_at", args).fetchall()
+        favorites = []
+        for row in rows:
+            item = json.loads(row["params"]) if row["params"] else {}
+            item.update({"path": row["path"], "prompt": row["prompt"], "timestamp": row["created_at"]})
+            favorites.append(item)
+        return favorites
+
+    def clear_favorites(self):
+        """Delete every favorite of the owner"""
+        where, args = self._where()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM favorites" + where, args)
+
+
+class ImageCache:
+    """
+    Bounded LRU of decoded images keyed by path; evicted images reload from disk
+
+    Only put images identical to the file at their path (e.g. not the
+    unwatermarked original of a watermarked save), or what is shown would
+    change after an eviction.
+    """
+
+    def __init__(self, max_images=12):
+        """
+        Initialize the cache
+
+        Args:
+            max_images: Images kept in memory
+        """
+        self.max_images = max_images
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, path, image):
+        """Keep an already-decoded image (e.g. a fresh generation) under its path"""
+        with self._lock:
+            self._images[path] = image
+            self._images.move_to_end(path)
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+
+    def get(self, path):
+        """
+        Image for a path, loading it from disk on a miss
+
+        Returns:
+            PIL Image, or None if the file no longer exists
+        """
+        with self._lock:
+            if path in self._images:
+                self._images.move_to_end(path)
+                return self._images[path]
+        if not os.path.exists(path):
+            return None
+        with Image.open(path) as opened:
+            image = opened.convert("RGB")
+        self.put(path, image)
+        return image
+
+    def discard(self, path):
+        """Drop one image"""
+        with self._lock:
+            self._images.pop(path, None)
+
+    def clear(self):
+        """Drop every image"""
+        with self._lock:
+            self._images.clear()
+
+    def __len__(self):
+        return len(self._images)
@@ -0,0 +1,240 @@
+"""
+Image Encoding Module
+Handles output formats (PNG, WebP, JPEG, AVIF), encoder settings and embedded metadata
+"""
+
+import argparse
+import json
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+try:
+    import pillow_avif  # noqa: F401  (registers AVIF with older Pillow versions)
+except ImportError:
+    pass
+
+
+# EXIF ImageDescription tag, used to carry the JSON metadata in WebP/JPEG/AVIF
+EXIF_DESCRIPTION_TAG = 0x010E
+
+# PNG tEXt key holding the JSON metadata
+PNG_METADATA_KEY = "generation_metadata"
+
+# Named encoder presets: Pillow format plus save() options
+ENCODING_PRESETS = {
+    "png": {"format": "PNG", "compress_level": 6},
+    "png_fast": {"format": "PNG", "compress_level": 1},
+    "png_small": {"format": "PNG", "compress_level": 9, "optimize": True},
+    "webp_lossless": {"format": "WEBP", "lossless": True, "quality": 25, "method": 1},
+    "webp": {"format": "WEBP", "quality": 90, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 92, "optimize": True},
+    "avif": {"format": "AVIF", "quality": 80},
+}
+
+FILE_EXTENSIONS = {
+    "PNG": ".png",
+    "WEBP": ".webp",
+    "JPEG": ".jpg",
+    "AVIF": ".avif",
+}
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "AVIF": "image/avif",
+}
+
+
+class ImageEncoder:
+    """Encode PIL images with a configurable format and embedded metadata"""
+
+    def __init__(self, preset="png", **options):
+        """
+        Initialize the encoder
+
+        Args:
+            preset: Name from ENCODING_PRESETS
+            **options: Overrides for the preset's Pillow save() options
+                       (e.g. quality=85, compress_level=3)
+        """
+        if preset not in ENCODING_PRESETS:
+            raise ValueError(f"Unknown encoding preset '{preset}'. Choose from: {', '.join(ENCODING_PRESETS)}")
+
+        settings = dict(ENCODING_PRESETS[preset])
+        settings.update(options)
+
+        self.preset = preset
+        self.format = settings.pop("format").upper()
+        self.options = settings
+
+        Image.init()  # Pillow registers most encoders lazily
+        if self.format not in Image.SAVE:
+            raise ValueError(f"Pillow has no {self.format} encoder available (install pillow-avif-plugin for AVIF)")
+
+    @property
+    def extension(self):
+        """File extension for the encoder's format"""
+        return FILE_EXTENSIONS[self.format]
+
+    @property
+    def mime_type(self):
+        """MIME type for the encoder's format"""
+        return MIME_TYPES[self.format]
+
+    def _save_kwargs(self, image, metadata):
+        """Build Pillow save() kwargs, embedding metadata for the format"""
+        kwargs = dict(self.options)
+        if not metadata:
+            return kwargs
+
+        payload = json.dumps(metadata, default=str)
+        if self.format == "PNG":
+            info = PngInfo()
+            info.add_text(PNG_METADATA_KEY, payload)
+            if "prompt" in metadata:
+                info.add_text("prompt", str(metadata["prompt"]))
+            kwargs["pnginfo"] = info
+        else:
+            exif = Image.Exif()
+            exif[EXIF_DESCRIPTION_TAG] = payload
+            kwargs["exif"] = exif.tobytes()
+        return kwargs
+
+    def _prepare(self, image):
+        """Convert modes the target format can't store"""
+        if self.format == "JPEG" and image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
+        return image
+
+    def encode(self, image, metadata=None):
+        """
+        Encode an image to bytes
+
+        Args:
+            image: PIL Image
+            metadata: Optional dict embedded in the file
+
+        Returns:
+            Encoded bytes
+        """
+        image = self._prepare(image)
+        buffer = BytesIO()
+        image.save(buffer, format=self.format, **self._save_kwargs(image, metadata))
+        return buffer.getvalue()
+
+    def save(self, image, path, metadata=None):
+        """
+        Encode an image straight to a file
+
+        Args:
+            image: PIL Image
+            path: Destination path
+            metadata: Optional dict embedded in the file
+        """
+        image = self._prepare(image)
+        image.save(path, format=self.format, **self._save_kwargs(image, metadata))
+
+
+def read_metadata(path_or_image):
+    """
+    Read generation metadata embedded by ImageEncoder
+
+    Args:
+        path_or_image: File path or PIL Image
+
+    Returns:
+        Metadata dict, or None if the image carries none
+    """
+    image = path_or_image if isinstance(path_or_image, Image.Image) else Image.open(path_or_image)
+
+    payload = image.info.get(PNG_METADATA_KEY)
+    if payload is None:
+        payload = image.getexif().get(EXIF_DESCRIPTION_TAG)
+    if not payload:
+        return None
+
+    try:
+        return json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+
+
+def _synthetic_image(size):
+    """Gradient plus noise test image (compresses like a real photo, not like a flat fill)"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([x, y, (x + y) // 2], axis=-1) * (255.0 / max(1, size - 1))
+    noise = rng.normal(0, 12, size=base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def benchmark_encoders(images, presets=None, repeats=3, metadata=None):
+    """
+    Measure encode time and output size for each preset
+
+    Args:
+        images: List of PIL Images
+        presets: Preset names to compare (default: every available preset)
+        repeats: Passes over the image list per preset (best pass is reported)
+        metadata: Optional metadata dict embedded in every image
+
+    Returns:
+        List of dicts with preset, format, ms_per_image, bytes_per_image
+    """
+    results = []
+    for preset in presets or list(ENCODING_PRESETS):
+        try:
+            encoder = ImageEncoder(preset)
+        except ValueError as e:
+            results.append({"preset": preset, "error": str(e)})
+            continue
+
+        best = None
+        total_bytes = 0
+        for _ in range(max(1, repeats)):
+            total_bytes = 0
+            start = time.perf_counter()
+            for image in images:
+                total_bytes += len(encoder.encode(image, metadata))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        results.append({
+            "preset": preset,
+            "format": encoder.format,
+            "ms_per_image": 1000.0 * best / len(images),
+            "bytes_per_image": total_bytes // len(images),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output encoders")
+    parser.add_argument("images", nargs="*", help="Images to encode (default: synthetic test images)")
+    parser.add_argument("--size", type=int, default=512, help="Synthetic image size")
+    parser.add_argument("--count", type=int, default=4, help="Number of synthetic images")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--presets", nargs="*", default=None)
+    args = parser.parse_args()
+
+    if args.images:
+        images = [Image.open(p).convert("RGB") for p in args.images]
+    else:
+        images = [_synthetic_image(args.size) for _ in range(args.count)]
+
+    metadata = {"prompt": "benchmark", "model": "n/a"}
+    print(f"{'preset':<15} {'format':<6} {'ms/image':>10} {'bytes/image':>12}")
+    for row in benchmark_encoders(images, args.presets, args.repeats, metadata):
+        if "error" in row:
+            print(f"{row['preset']:<15} skipped: {row['error']}")
+            continue
+        print(f"{row['preset']:<15} {row['format']:<6} {row['ms_per_image']:>10.1f} {row['bytes_per_image']:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,254 +1,1251 @@
-"""
-AI Image Generator Core Module
-Handles Stable Diffusion model loading and image generation
-"""
-
-import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
-from PIL import Image, ImageDraw, ImageFont
-import os
-from datetime import datetime
-import json
-
-
-class ImageGenerator:
-    def __init__(self, model_id="stabilityai/stable-diffusion-2-1", device=None, hf_token=None):
-        """
-        Initialize the image generator with Stable Diffusion model
-        
-        Args:
-            model_id: HuggingFace model identifier
-            device: 'cuda' for GPU, 'cpu' for CPU, None for auto-detect
-            hf_token: HuggingFace authentication token (for gated models)
-        """
-        self.model_id = model_id
-        self.hf_token = hf_token or os.environ.get("HF_TOKEN") or os.environ.get("HUGGING_FACE_HUB_TOKEN")
-        
-        # Auto-detect device if not specified
-        if device is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        else:
-            self.device = device
-            
-        print(f"Using device: {self.device}")
-        
-        # Load model
-        self.pipe = None
-        self.load_model()
-        
-    def load_model(self):
-        """Load the Stable Diffusion pipeline"""
-        print(f"Loading model: {self.model_id}...")
-        
-        try:
-            # Prepare kwargs for loading
-            load_kwargs = {
-                "torch_dtype": torch.float16 if self.device == "cuda" else torch.float32,
-                "safety_checker": None,  # Disable for faster generation
-                "requires_safety_checker": False
-            }
-            
-            # Add token if available (required for gated models)
-            if self.hf_token:
-                load_kwargs["token"] = self.hf_token
-                print("Using HuggingFace authentication token")
-            
-            # Load pipeline with optimizations
-            self.pipe = StableDiffusionPipeline.from_pretrained(
-                self.model_id,
-                **load_kwargs
-            )
-            
-            # Use faster scheduler
-            self.pipe.scheduler = DPMSolverMultistepScheduler.from_config(
-                self.pipe.scheduler.config
-            )
-            
-            # Move to device
-            self.pipe = self.pipe.to(self.device)
-            
-            # Enable memory optimizations for GPU
-            if self.device == "cuda":
-                self.pipe.enable_attention_slicing()
-                # Uncomment if you have limited VRAM
-                # self.pipe.enable_vae_slicing()
-                # self.pipe.enable_sequential_cpu_offload()
-            
-            print("Model loaded successfully!")
-            
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            raise
-    
-    def enhance_prompt(self, prompt, style="realistic"):
-        """
-        Enhance prompts with quality descriptors
-        
-        Args:
-            prompt: User's text prompt
-            style: Generation style (realistic, artistic, cartoon, etc.)
-        """
-        style_templates = {
-            "realistic": "highly detailed, photorealistic, 4K, professional photography",
-            "artistic": "artistic, oil painting, masterpiece, highly detailed",
-            "cartoon": "cartoon style, animated, vibrant colors, cel shaded",
-            "anime": "anime style, manga, detailed, vibrant",
-            "cyberpunk": "cyberpunk style, neon lights, futuristic, dystopian",
-            "fantasy": "fantasy art, magical, ethereal, detailed"
-        }
-        
-        enhancement = style_templates.get(style, style_templates["realistic"])
-        enhanced_prompt = f"{prompt}, {enhancement}"
-        
-        return enhanced_prompt
-    
-    def generate_images(
-        self,
-        prompt,
-        negative_prompt="",
-        num_images=1,
-        style="realistic",
-        num_inference_steps=50,
-        guidance_scale=7.5,
-        height=512,
-        width=512,
-        seed=None
-    ):
-        """
-        Generate images from text prompt
-        
-        Args:
-            prompt: Text description of desired image
-            negative_prompt: Things to avoid in generation
-            num_images: Number of images to generate
-            style: Generation style
-            num_inference_steps: More steps = higher quality (20-100)
-            guidance_scale: How closely to follow prompt (5-15)
-            height: Image height (multiples of 8)
-            width: Image width (multiples of 8)
-            seed: Random seed for reproducibility
-            
-        Returns:
-            List of PIL Images
-        """
-        # Enhance prompt based on style
-        enhanced_prompt = self.enhance_prompt(prompt, style)
-        
-        # Default negative prompt
-        default_negative = "blurry, bad quality, distorted, deformed, ugly, low resolution"
-        if negative_prompt:
-            negative_prompt = f"{negative_prompt}, {default_negative}"
-        else:
-            negative_prompt = default_negative
-        
-        # Set random seed if provided
-        generator = None
-        if seed is not None:
-            generator = torch.Generator(device=self.device).manual_seed(seed)
-        
-        print(f"Generating {num_images} image(s)...")
-        print(f"Enhanced prompt: {enhanced_prompt}")
-        
-        try:
-            # Generate images
-            output = self.pipe(
-                prompt=enhanced_prompt,
-                negative_prompt=negative_prompt,
-                num_images_per_prompt=num_images,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                height=height,
-                width=width,
-                generator=generator
-            )
-            
-            images = output.images
-            print(f"Successfully generated {len(images)} image(s)")
-            
-            return images
-            
-        except Exception as e:
-            print(f"Error generating images: {e}")
-            raise
-    
-    def add_watermark(self, image):
-        """Add AI-generated watermark to image"""
-        draw = ImageDraw.Draw(image)
-        watermark_text = "AI Generated"
-        
-        # Position watermark at bottom right
-        width, height = image.size
-        
-        # Use default font
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        # Get text bounding box
-        bbox = draw.textbbox((0, 0), watermark_text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        # Position
-        x = width - text_width - 10
-        y = height - text_height - 10
-        
-        # Draw semi-transparent background
-        padding = 5
-        draw.rectangle(
-            [x - padding, y - padding, x + text_width + padding, y + text_height + padding],
-            fill=(0, 0, 0, 128)
-        )
-        
-        # Draw text
-        draw.text((x, y), watermark_text, fill=(255, 255, 255), font=font)
-        
-        return image
-    
-    def save_images(self, images, prompt, output_dir="generated_images", add_watermark=True):
-        """
-        Save generated images with metadata
-        
-        Args:
-            images: List of PIL Images
-            prompt: Original prompt
-            output_dir: Directory to save images
-            add_watermark: Whether to add AI watermark
-            
-        Returns:
-            List of saved file paths
-        """
-        os.makedirs(output_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        saved_paths = []
-        
-        for i, image in enumerate(images):
-            # Add watermark if requested
-            if add_watermark:
-                image = self.add_watermark(image)
-            
-            # Generate filename
-            filename = f"generated_{timestamp}_{i+1}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            # Save image
-            image.save(filepath, "PNG")
-            saved_paths.append(filepath)
-            
-            # Save metadata
-            metadata = {
-                "prompt": prompt,
-                "timestamp": timestamp,
-                "filename": filename,
-                "model": self.model_id
-            }
-            
-            metadata_file = filepath.replace(".png", "_metadata.json")
-            with open(metadata_file, "w") as f:
-                json.dump(metadata, f, indent=2)
-            
-            print(f"Saved: {filepath}")
-        
-        return saved_paths
\ No newline at end of file
+"""
+AI Image Generator Core Module
+Handles Stable Diffusion model loading and image generation
+"""
+
+import torch
+from collections import OrderedDict
+from diffusers import (
+    StableDiffusionImg2ImgPipeline,
+    StableDiffusionInpaintPipeline,
+    StableDiffusionPipeline,
+)
+from PIL import Image
+import os
+from datetime import datetime
+import inspect
+import json
+import logging
+import random
+import time
+
+from adapters import AdapterManager
+from cost_model import CostModel
+from image_encoding import ImageEncoder
+from metadata_store import MetadataStore
+from output_paths import atomic_write_bytes, build_output_path
+from profiling import GenerationProfiler
+from prompt_budget import LONG_PROMPT_MODES, PromptBudget
+from prompt_utils import normalize_prompt
+from schedulers import DEFAULT_SCHEDULER, available_schedulers, build_scheduler, resolve_settings
+from structured_logging import get_logger, log_event
+from watermark import WatermarkEngine
+
+
+logger = get_logger("generator")
+
+
+# (width, height) of the app's size presets and the batch sizes its slider offers
+WARMUP_SHAPES = [(512, 512), (512, 768), (768, 512), (1024, 1024)]
+WARMUP_BATCH_SIZES = [1, 2, 4]
+
+# Draft resolution relative to the final size, and steps per draft
+DRAFT_SCALE = 0.5
+DRAFT_STEPS = 10
+
+
+class GenerationInterrupted(Exception):
+    """Raised by a step_callback to abandon a pipeline call between denoising steps"""
+
+
+class ImageGenerator:
+    def __init__(
+        self,
+        model_id="stabilityai/stable-diffusion-2-1",
+        device=None,
+        hf_token=None,
+        profiler=None,
+        watermark=None,
+        cost_model=None,
+        warmup=None,
+        registry=None,
+        adapter_dir=None,
+        exclusive=None
+    ):
+        """
+        Initialize the image generator with Stable Diffusion model
+        
+        Args:
+            model_id: HuggingFace model identifier
+            device: 'cuda' for GPU, 'cpu' for CPU, None for auto-detect
+            hf_token: HuggingFace authentication token (for gated models)
+            profiler: GenerationProfiler; None builds one from IMAGE_GEN_PROFILE* env vars
+            watermark: WatermarkEngine used by add_watermark (None = default "AI Generated")
+            cost_model: CostModel calibrated by every generate_images call (None = default file)
+            warmup: Run warm_up() after every load_model; None reads IMAGE_GEN_WARMUP
+                    (default: on for CUDA, off for CPU where it would take minutes)
+            registry: ModelRegistry shared between generators, so resident checkpoints are
+                      reused and identical components shared; None loads a private pipeline
+            adapter_dir: Directory of LoRA files registered as adapters by file name;
+                         None reads IMAGE_GEN_LORA_DIR (default "loras")
+            exclusive: Callable exclusive(func) that runs func where no other pipeline
+                       call can overlap it (e.g. on a GenerationScheduler's worker);
+                       load_model runs pipeline setup and warm-up through it.
+                       None runs them directly
+        """
+        self.model_id = model_id
+        self.profiler = profiler or GenerationProfiler()
+        self.watermark = watermark or WatermarkEngine()
+        self.registry = registry
+        self.adapter_dir = adapter_dir or os.environ.get("IMAGE_GEN_LORA_DIR", "loras")
+        self.adapters = None
+        self.exclusive = exclusive or (lambda func: func())
+        self.cost_model = cost_model or CostModel()
+        self.hf_token = hf_token or os.environ.get("HF_TOKEN") or os.environ.get("HUGGING_FACE_HUB_TOKEN")
+        
+        # Auto-detect device if not specified
+        if device is None:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        else:
+            self.device = device
+            
+        log_event(logger, "generator.device", device=self.device)
+        
+        # Load model
+        self.pipe = None
+        self.last_generation_params = None
+        self._metadata_stores = {}
+        self._schedulers = {}
+        self._scheduler_config = None
+        self._derived_pipes = {}
+        self.scheduler_name = None
+        self.last_drafts = None
+        self.prompt_budget = None
+        self._embedding_cache = OrderedDict()
+        self.embedding_cache_size = 256
+        
+        if warmup is None:
+            setting = os.environ.get("IMAGE_GEN_WARMUP", "").strip().lower()
+            warmup = setting in ("1", "true", "on") if setting else self.device == "cuda"
+        self.warmup = warmup
+        self.warmup_shapes = list(WARMUP_SHAPES)
+        self.warmup_batch_sizes = list(WARMUP_BATCH_SIZES)
+        self.warmup_report = None
+        self.load_info = None
+        self.load_model()
+        
+    def load_model(self):
+        """Load the Stable Diffusion pipeline"""
+        log_event(logger, "model.load.start", model=self.model_id)
+        start = time.perf_counter()
+        
+        try:
+            # Prepare kwargs for loading
+            load_kwargs = {
+                "torch_dtype": torch.float16 if self.device == "cuda" else torch.float32,
+                "safety_checker": None,  # Disable for faster generation
+                "requires_safety_checker": False
+            }
+            
+            # Add token if available (required for gated models)
+            if self.hf_token:
+                load_kwargs["token"] = self.hf_token
+                logger.debug("model.load.auth_token")
+            
+            # Load pipeline with optimizations
+            if self.registry is not None:
+                self.pipe, self.load_info = self.registry.acquire(self.model_id, self.device, **load_kwargs)
+                scheduler_config = self.registry.scheduler_config(self.model_id, self.device)
+            else:
+                self.pipe = StableDiffusionPipeline.from_pretrained(
+                    self.model_id,
+                    **load_kwargs
+                )
+                self.load_info = {"resident": False, "shared": []}
+                scheduler_config = self.pipe.scheduler.config
+            
+            # Keep the checkpoint's scheduler config so any registered
+            # scheduler can be swapped in per request without reloading
+            self._scheduler_config = scheduler_config
+            
+            # One adapter manager per pipeline, shared by every generator using it
+            self.adapters = AdapterManager.for_pipeline(
+                self.pipe,
+                fuse_hot_after=int(os.environ.get("IMAGE_GEN_LORA_FUSE_AFTER", 8)) or None,
+                fuse_allowed=self._can_fuse_adapters
+            )
+            self._schedulers = {}
+            self._derived_pipes = {}
+            self.scheduler_name = None
+            self.prompt_budget = PromptBudget(self.pipe.tokenizer)
+            self._embedding_cache.clear()
+            
+            # A resident pipeline was set up (and warmed up, if enabled) when first
+            # loaded, and other generators may be running it; every request sets
+            # its own scheduler. A fresh one is set up without overlapping any
+            # pipeline call, since the registry already hands it out.
+            if not self.load_info["resident"]:
+                self.exclusive(self._prepare_pipeline)
+            
+            log_event(
+                logger, "model.load.done",
+                model=self.model_id,
+                device=self.device,
+                resident=self.load_info["resident"],
+                shared=self.load_info["shared"],
+                duration_s=round(time.perf_counter() - start, 3)
+            )
+            
+        except Exception as e:
+            log_event(logger, "model.load.error", level=logging.ERROR, model=self.model_id, error=str(e))
+            raise
+    
+    def _prepare_pipeline(self):
+        """Register adapters, select the default scheduler, optimize memory and warm up a fresh pipeline"""
+        self.adapters.register_directory(self.adapter_dir)
+        self.set_scheduler(DEFAULT_SCHEDULER)
+        
+        # Move to device
+        self.pipe = self.pipe.to(self.device)
+        
+        # Enable memory optimizations for GPU
+        if self.device == "cuda":
+            self.pipe.enable_attention_slicing()
+            # Uncomment if you have limited VRAM
+            # self.pipe.enable_vae_slicing()
+            # self.pipe.enable_sequential_cpu_offload()
+        
+        if self.warmup:
+            self.warm_up()
+    
+    def _warmup_call(self, width, height, batch_size, steps):
+        """One tiny dummy generation through the same path as generate_images; returns seconds"""
+        start = time.perf_counter()
+        if hasattr(self.pipe, "encode_prompt"):
+            embeds = self.encode_text("")
+            prompt_kwargs = {"prompt_embeds": embeds, "negative_prompt_embeds": embeds}
+        else:
+            prompt_kwargs = {"prompt": "", "negative_prompt": ""}
+        with torch.no_grad():
+            self.pipe(
+                **prompt_kwargs,
+                num_images_per_prompt=batch_size,
+                num_inference_steps=steps,
+                height=height,
+                width=width,
+                generator=torch.Generator(device=self.device).manual_seed(0)
+            )
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        return time.perf_counter() - start
+    
+    def warm_up(self, shapes=None, batch_sizes=None, steps=2):
+        """
+        Run tiny dummy generations so the first real request doesn't pay for
+        kernel selection, allocator growth and lazy initialization
+        
+        The first shape at batch size 1 is timed before and after the sweep to
+        show what a freshly loaded model's first request costs with and
+        without warm-up. Shapes that fail (e.g. out of memory) are skipped.
+        Like any pipeline call, it must not overlap other work on the pipeline
+        (load_model runs it through exclusive).
+        
+        Args:
+            shapes: (width, height) pairs; None uses self.warmup_shapes
+            batch_sizes: Batch sizes per shape; None uses self.warmup_batch_sizes
+            steps: Denoising steps per dummy generation
+            
+        Returns:
+            Report dict, also kept as self.warmup_report
+        """
+        shapes = list(shapes or self.warmup_shapes)
+        batch_sizes = list(batch_sizes or self.warmup_batch_sizes)
+        reference = shapes[0]
+        log_event(logger, "model.warmup.start", shapes=len(shapes), batch_sizes=batch_sizes, steps=steps)
+        start = time.perf_counter()
+        self.adapters.activate(None)
+        
+        cold_s = self._warmup_call(reference[0], reference[1], 1, steps)
+        timings = {}
+        for width, height in shapes:
+            for batch_size in batch_sizes:
+                key = f"{batch_size}x{width}x{height}"
+                try:
+                    timings[key] = round(self._warmup_call(width, height, batch_size, steps), 3)
+                except Exception as e:
+                    timings[key] = None
+                    if self.device == "cuda":
+                        torch.cuda.empty_cache()
+                    log_event(logger, "model.warmup.skipped", level=logging.WARNING, shape=key, error=str(e))
+        warm_s = self._warmup_call(reference[0], reference[1], 1, steps)
+        
+        self.warmup_report = {
+            "duration_s": round(time.perf_counter() - start, 3),
+            "reference": f"1x{reference[0]}x{reference[1]}",
+            "steps": steps,
+            "first_request_s": round(cold_s, 3),
+            "warm_request_s": round(warm_s, 3),
+            "shapes": timings,
+        }
+        log_event(
+            logger, "model.warmup.done",
+            model=self.model_id,
+            duration_s=self.warmup_report["duration_s"],
+            first_request_s=self.warmup_report["first_request_s"],
+            warm_request_s=self.warmup_report["warm_request_s"],
+            skipped=[key for key, value in timings.items() if value is None]
+        )
+        return self.warmup_report
+    
+    def _can_fuse_adapters(self):
+        """Fusing rewrites base weights, so it is off while components are shared with another checkpoint"""
+        return self.registry is None or not self.registry.is_shared(self.model_id, self.device)
+    
+    def set_scheduler(self, name=None):
+        """
+        Swap the pipeline's scheduler (instances are cached, the model is not reloaded)
+        
+        Args:
+            name: Registry name from schedulers.SCHEDULERS; None selects the default.
+                  ValueError if it isn't usable with the loaded model (LCM on
+                  weights that aren't LCM-distilled)
+            
+        Returns:
+            The active scheduler name
+        """
+        name = name or DEFAULT_SCHEDULER
+        if name not in self._schedulers:
+            self._schedulers[name] = build_scheduler(name, self._scheduler_config, self.model_id)
+        self.pipe.scheduler = self._schedulers[name]
+        for pipe in self._derived_pipes.values():
+            pipe.scheduler = self.pipe.scheduler
+        self.scheduler_name = name
+        return name
+    
+    def available_schedulers(self):
+        """Scheduler names usable with the loaded model"""
+        return available_schedulers(self.model_id)
+    
+    def enhance_prompt(self, prompt, style="realistic"):
+        """
+        Enhance prompts with quality descriptors
+        
+        Args:
+            prompt: User's text prompt
+            style: Generation style (realistic, artistic, cartoon, etc.)
+        """
+        style_templates = {
+            "realistic": "highly detailed, photorealistic, 4K, professional photography",
+            "artistic": "artistic, oil painting, masterpiece, highly detailed",
+            "cartoon": "cartoon style, animated, vibrant colors, cel shaded",
+            "anime": "anime style, manga, detailed, vibrant",
+            "cyberpunk": "cyberpunk style, neon lights, futuristic, dystopian",
+            "fantasy": "fantasy art, magical, ethereal, detailed"
+        }
+        
+        enhancement = style_templates.get(style, style_templates["realistic"])
+        # Style modifiers the prompt already contains are not repeated, and
+        # those that would overflow the 77-token window are dropped
+        if self.prompt_budget is not None:
+            return self.prompt_budget.fit(prompt, enhancement)
+        enhanced_prompt = normalize_prompt(prompt, enhancement)
+        
+        return enhanced_prompt
+    
+    def encode_text(self, text):
+        """
+        Text-encoder embeddings for one prompt, cached per text and active adapters
+        
+        Batch jobs that share a negative prompt (or repeat a prompt) encode it once.
+        
+        Args:
+            text: Final prompt or negative prompt
+            
+        Returns:
+            Embeddings tensor (1, 77, dim)
+        """
+        # LoRA adapters may change the text encoder's output
+        key = (self.adapters.active, text)
+        embeds = self._embedding_cache.get(key)
+        if embeds is not None:
+            self._embedding_cache.move_to_end(key)
+            return embeds
+        
+        with torch.no_grad():
+            embeds, _ = self.pipe.encode_prompt(text, self.device, 1, False)
+        self._embedding_cache[key] = embeds
+        while len(self._embedding_cache) > self.embedding_cache_size:
+            self._embedding_cache.popitem(last=False)
+        return embeds
+    
+    def build_negative_prompt(self, negative_prompt=""):
+        """
+        Combine the user's negative prompt with the default negatives
+        
+        Args:
+            negative_prompt: User's negative prompt (may be empty)
+        """
+        default_negative = "blurry, bad quality, distorted, deformed, ugly, low resolution"
+        if self.prompt_budget is not None:
+            return self.prompt_budget.fit(negative_prompt, default_negative)
+        return normalize_prompt(negative_prompt, default_negative)
+    
+    def generate_images(
+        self,
+        prompt,
+        negative_prompt="",
+        num_images=1,
+        style="realistic",
+        num_inference_steps=None,
+        guidance_scale=7.5,
+        height=512,
+        width=512,
+        seed=None,
+        profile=None,
+        scheduler=None,
+        preset=None,
+        seeds=None,
+        draft=False,
+        long_prompts="truncate",
+        step_callback=None,
+        adapter=None
+    ):
+        """
+        Generate images from text prompt
+        
+        Args:
+            prompt: Text description of desired image
+            negative_prompt: Things to avoid in generation
+            num_images: Number of images to generate
+            style: Generation style
+            num_inference_steps: More steps = higher quality; None uses the scheduler's recommended count
+            guidance_scale: How closely to follow prompt (5-15)
+            height: Image height (multiples of 8)
+            width: Image width (multiples of 8)
+            seed: Base seed; image k uses seed + k, so it can be reproduced on its own
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            scheduler: Registry name from schedulers.SCHEDULERS (e.g. 'dpmpp_2m', 'euler_a', 'unipc')
+            preset: 'fast', 'balanced' or 'quality' (scheduler + steps; explicit values win)
+            seeds: Explicit per-image seeds (overrides seed; length must equal num_images)
+            draft: Return fast low-step, low-resolution drafts instead; pick one and
+                   pass it to refine_draft() (the draft set is kept in self.last_drafts)
+            long_prompts: 'truncate' (the encoder sees the first 75 tokens) or 'chunk'
+                          (prompts over 75 tokens are encoded in windows and concatenated)
+            step_callback: Called as step_callback(step_index, timestep, latents) after every
+                           denoising step; raising GenerationInterrupted abandons the call
+            adapter: LoRA adapter(s) registered on self.adapters: a name, a list of names
+                     or {name: weight}; None generates with the base weights
+            
+        Returns:
+            List of PIL Images
+        """
+        if long_prompts not in LONG_PROMPT_MODES:
+            raise ValueError(f"Unknown long_prompts '{long_prompts}'. Choose from: {', '.join(LONG_PROMPT_MODES)}")
+        
+        if draft:
+            self.last_drafts = self.generate_drafts(
+                prompt,
+                negative_prompt=negative_prompt,
+                num_images=num_images,
+                style=style,
+                guidance_scale=guidance_scale,
+                height=height,
+                width=width,
+                seed=seed,
+                seeds=seeds,
+                final_steps=num_inference_steps,
+                final_scheduler=scheduler,
+                final_preset=preset,
+                profile=profile,
+                adapter=adapter
+            )
+            return self.last_drafts["images"]
+        
+        scheduler, num_inference_steps = resolve_settings(preset, scheduler, num_inference_steps)
+        self.set_scheduler(scheduler)
+        adapter = self.adapters.activate(adapter)
+        
+        # Enhance prompt based on style
+        enhanced_prompt = self.enhance_prompt(prompt, style)
+        
+        # Default negative prompt
+        negative_prompt = self.build_negative_prompt(negative_prompt)
+        
+        # One generator per image: image k depends only on seeds[k], never on
+        # the batch it was rendered in, so batches can be split and merged freely
+        seeds = self.make_seeds(num_images, seed, seeds)
+        generator = [torch.Generator(device=self.device).manual_seed(s) for s in seeds]
+        
+        log_event(
+            logger, "generate.start", level=logging.DEBUG,
+            prompt=enhanced_prompt,
+            num_images=num_images,
+            steps=num_inference_steps,
+            size=f"{width}x{height}",
+            adapters=[name for name, _ in adapter]
+        )
+        start = time.perf_counter()
+        
+        # Only prompts that actually overflow pay for chunked encoding
+        if long_prompts == "chunk" and not (
+            self.prompt_budget.fits(enhanced_prompt) and self.prompt_budget.fits(negative_prompt)
+        ):
+            prompt_embeds, negative_embeds = self.prompt_budget.encode_long_prompt(
+                self.pipe.text_encoder,
+                enhanced_prompt,
+                negative_prompt,
+                self.device,
+                dtype=self.pipe.text_encoder.dtype
+            )
+            prompt_kwargs = {"prompt_embeds": prompt_embeds, "negative_prompt_embeds": negative_embeds}
+        elif hasattr(self.pipe, "encode_prompt"):
+            prompt_kwargs = {
+                "prompt_embeds": self.encode_text(enhanced_prompt),
+                "negative_prompt_embeds": self.encode_text(negative_prompt),
+            }
+        else:
+            prompt_kwargs = {"prompt": enhanced_prompt, "negative_prompt": negative_prompt}
+        
+        if step_callback is not None:
+            prompt_kwargs.update(self._step_callback_kwargs(step_callback))
+        
+        try:
+            # Generate images
+            with self.profiler.profile("generate_images", force=profile) as profile_report:
+                output = self.pipe(
+                    **prompt_kwargs,
+                    num_images_per_prompt=num_images,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    height=height,
+                    width=width,
+                    generator=generator
+                )
+            
+            images = output.images
+            duration = time.perf_counter() - start
+            log_event(
+                logger, "generate.done",
+                num_images=len(images),
+                scheduler=scheduler,
+                steps=num_inference_steps,
+                size=f"{width}x{height}",
+                seeds=seeds,
+                duration_s=round(duration, 3)
+            )
+            # Profiled runs (forced or sampled) are slowed down by the profiler
+            if not profile_report["profiled"]:
+                self.cost_model.observe(
+                    self.model_id, self.device, width, height, num_images, num_inference_steps, duration
+                )
+            
+            # Remembered so save_images can record the full parameters
+            self.last_generation_params = {
+                "prompt": prompt,
+                "enhanced_prompt": enhanced_prompt,
+                "negative_prompt": negative_prompt,
+                "style": style,
+                "seed": seeds[0],
+                "seeds": seeds,
+                "scheduler": scheduler,
+                "num_inference_steps": num_inference_steps,
+                "guidance_scale": guidance_scale,
+                "width": width,
+                "height": height,
+                "num_images": num_images,
+                "adapter": dict(adapter) or None,
+                "generate_s": round(duration, 3)
+            }
+            
+            return images
+            
+        except GenerationInterrupted:
+            log_event(logger, "generate.interrupted", level=logging.DEBUG, seeds=seeds)
+            raise
+        except Exception as e:
+            log_event(logger, "generate.error", level=logging.ERROR, error=str(e))
+            raise
+    
+    def _step_callback_kwargs(self, step_callback):
+        """Adapt step_callback(step_index, timestep, latents) to the pipeline's callback API"""
+        if "callback_on_step_end" in inspect.signature(self.pipe.__call__).parameters:
+            def callback_on_step_end(pipe, step_index, timestep, callback_kwargs):
+                step_callback(step_index, timestep, callback_kwargs["latents"])
+                return callback_kwargs
+            return {"callback_on_step_end": callback_on_step_end}
+        return {"callback": step_callback, "callback_steps": 1}
+    
+    @staticmethod
+    def make_seeds(num_images, seed=None, seeds=None):
+        """
+        Build the per-image seed list for a batch
+        
+        Args:
+            num_images: Batch size
+            seed: Base seed; image k gets seed + k (None draws random seeds)
+            seeds: Explicit seeds, returned as-is after a length check
+            
+        Returns:
+            List of num_images ints
+        """
+        if seeds is not None:
+            seeds = [int(s) for s in seeds]
+            if len(seeds) != num_images:
+                raise ValueError(f"Got {len(seeds)} seeds for {num_images} image(s)")
+            return seeds
+        if seed is None:
+            return [random.randrange(2**31 - 1) for _ in range(num_images)]
+        return [int(seed) + k for k in range(num_images)]
+    
+    def render_variations(
+        self,
+        prompts,
+        negative_prompts=None,
+        style="realistic",
+        images_per_prompt=1,
+        num_inference_steps=None,
+        guidance_scale=7.5,
+        height=512,
+        width=512,
+        seed=None,
+        max_batch_size=4,
+        profile=None,
+        scheduler=None,
+        preset=None,
+        adapter=None
+    ):
+        """
+        Render prompt variations in one batched pipeline call with a shared seed schedule
+        
+        Every (prompt, negative prompt) pair is rendered with the same list of seeds,
+        so column k of the grid always starts from the same noise and differences
+        between rows come from the prompt alone.
+        
+        Args:
+            prompts: Prompt variations (e.g. from PromptVariator.generate_variations)
+            negative_prompts: Negative prompt variations (e.g. from
+                              PromptVariator.create_negative_prompt_variations); None uses one empty negative
+            style: Generation style
+            images_per_prompt: Seeds per (prompt, negative) pair
+            num_inference_steps: Denoising steps; None uses the scheduler's recommended count
+            guidance_scale: How closely to follow prompt
+            height: Image height (multiples of 8)
+            width: Image width (multiples of 8)
+            seed: First seed of the schedule; None picks a random one
+            max_batch_size: Split into several pipeline calls of at most this many images
+                            (default 4, so large grids don't run out of memory; None = one call)
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            scheduler: Registry name from schedulers.SCHEDULERS
+            preset: 'fast', 'balanced' or 'quality'
+            adapter: LoRA adapter(s), as in generate_images
+            
+        Returns:
+            Dict with 'images' (row-major: prompt, then negative, then seed), 'jobs'
+            (prompt, negative_prompt, seed per image), 'rows', 'cols' and 'seeds'
+        """
+        scheduler, num_inference_steps = resolve_settings(preset, scheduler, num_inference_steps)
+        self.set_scheduler(scheduler)
+        adapter = self.adapters.activate(adapter)
+        
+        negative_prompts = list(negative_prompts) if negative_prompts else [""]
+        seeds = self.make_seeds(images_per_prompt, seed)
+        
+        jobs = [
+            {"prompt": p, "negative_prompt": n, "seed": s}
+            for p in prompts for n in negative_prompts for s in seeds
+        ]
+        batch_size = max_batch_size or len(jobs)
+        
+        log_event(
+            logger, "variations.start",
+            num_prompts=len(prompts),
+            num_negatives=len(negative_prompts),
+            num_images=len(jobs),
+            pipeline_calls=-(-len(jobs) // batch_size)
+        )
+        start = time.perf_counter()
+        
+        images = []
+        with self.profiler.profile("render_variations", force=profile):
+            for offset in range(0, len(jobs), batch_size):
+                chunk = jobs[offset:offset + batch_size]
+                output = self.pipe(
+                    prompt=[self.enhance_prompt(job["prompt"], style) for job in chunk],
+                    negative_prompt=[self.build_negative_prompt(job["negative_prompt"]) for job in chunk],
+                    num_images_per_prompt=1,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    height=height,
+                    width=width,
+                    generator=[torch.Generator(device=self.device).manual_seed(job["seed"]) for job in chunk]
+                )
+                images.extend(output.images)
+        
+        duration = time.perf_counter() - start
+        log_event(
+            logger, "variations.done",
+            num_images=len(images),
+            steps=num_inference_steps,
+            size=f"{width}x{height}",
+            duration_s=round(duration, 3)
+        )
+        
+        self.last_generation_params = {
+            "style": style,
+            "scheduler": scheduler,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "width": width,
+            "height": height,
+            "seed_schedule": seeds,
+            "adapter": dict(adapter) or None,
+            "generate_s": round(duration, 3)
+        }
+        
+        return {
+            "images": images,
+            "jobs": jobs,
+            "rows": len(prompts),
+            "cols": len(negative_prompts) * len(seeds),
+            "seeds": seeds
+        }
+    
+    def get_pipeline(self, mode):
+        """
+        Get an img2img or inpaint pipeline built from the loaded components
+        
+        The derived pipeline shares the UNet, VAE, text encoder, tokenizer and
+        scheduler of self.pipe, so it costs no extra weights and no second
+        from_pretrained.
+        
+        Args:
+            mode: 'img2img' or 'inpaint'
+            
+        Returns:
+            Diffusers pipeline
+        """
+        pipeline_classes = {
+            "img2img": StableDiffusionImg2ImgPipeline,
+            "inpaint": StableDiffusionInpaintPipeline,
+        }
+        if mode not in pipeline_classes:
+            raise ValueError(f"Unknown pipeline mode '{mode}'. Choose from: {', '.join(pipeline_classes)}")
+        
+        if mode not in self._derived_pipes:
+            components = dict(self.pipe.components)
+            components["safety_checker"] = None
+            pipe = pipeline_classes[mode](**components, requires_safety_checker=False)
+            pipe.set_progress_bar_config(disable=True)
+            self._derived_pipes[mode] = pipe
+            log_event(logger, "pipeline.derived", mode=mode)
+        return self._derived_pipes[mode]
+    
+    def _run_derived(self, mode, label, pipe_kwargs, prompt, negative_prompt, style, num_images,
+                     strength, num_inference_steps, guidance_scale, seed, scheduler, preset, profile,
+                     adapter=None):
+        """Shared driver for img2img and inpaint calls"""
+        scheduler, num_inference_steps = resolve_settings(preset, scheduler, num_inference_steps)
+        self.set_scheduler(scheduler)
+        self.adapters.activate(adapter)
+        pipe = self.get_pipeline(mode)
+        
+        enhanced_prompt = self.enhance_prompt(prompt, style) if style else prompt
+        negative_prompt = self.build_negative_prompt(negative_prompt)
+        seeds = self.make_seeds(num_images, seed)
+        
+        start = time.perf_counter()
+        with self.profiler.profile(label, force=profile):
+            output = pipe(
+                prompt=enhanced_prompt,
+                negative_prompt=negative_prompt,
+                num_images_per_prompt=num_images,
+                strength=strength,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                generator=[torch.Generator(device=self.device).manual_seed(s) for s in seeds],
+                **pipe_kwargs
+            )
+        duration = time.perf_counter() - start
+        
+        log_event(
+            logger, f"{label}.done",
+            num_images=len(output.images),
+            scheduler=scheduler,
+            steps=num_inference_steps,
+            # Only the last `strength` fraction of the schedule is denoised
+            effective_steps=int(num_inference_steps * strength),
+            strength=strength,
+            duration_s=round(duration, 3)
+        )
+        
+        self.last_generation_params = {
+            "mode": mode,
+            "prompt": prompt,
+            "enhanced_prompt": enhanced_prompt,
+            "negative_prompt": negative_prompt,
+            "style": style,
+            "seed": seeds[0],
+            "seeds": seeds,
+            "scheduler": scheduler,
+            "num_inference_steps": num_inference_steps,
+            "strength": strength,
+            "guidance_scale": guidance_scale,
+            "num_images": num_images,
+            "generate_s": round(duration, 3)
+        }
+        return output.images
+    
+    @staticmethod
+    def _fit_to_latent_grid(image):
+        """Crop the image so both sides are multiples of 8 (required by the VAE)"""
+        width, height = image.size
+        width, height = width - width % 8, height - height % 8
+        if (width, height) != image.size:
+            image = image.crop((0, 0, width, height))
+        return image.convert("RGB")
+    
+    def img2img(
+        self,
+        image,
+        prompt,
+        negative_prompt="",
+        strength=0.3,
+        style=None,
+        num_images=1,
+        num_inference_steps=None,
+        guidance_scale=7.5,
+        seed=None,
+        scheduler=None,
+        preset=None,
+        profile=None,
+        adapter=None
+    ):
+        """
+        Transform an existing image guided by a prompt
+        
+        Args:
+            image: Source PIL Image
+            prompt: Text description of desired image
+            negative_prompt: Things to avoid in generation
+            strength: 0-1; how much of the schedule is re-run (0.2-0.4 keeps composition)
+            style: Generation style; None uses the prompt as-is
+            num_images: Number of images to generate
+            num_inference_steps: Full schedule length (only strength x steps are run)
+            guidance_scale: How closely to follow prompt
+            seed: Base seed (image k uses seed + k)
+            scheduler: Registry name from schedulers.SCHEDULERS
+            preset: 'fast', 'balanced' or 'quality'
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            adapter: LoRA adapter(s), as in generate_images
+            
+        Returns:
+            List of PIL Images
+        """
+        return self._run_derived(
+            "img2img", "img2img",
+            {"image": self._fit_to_latent_grid(image)},
+            prompt, negative_prompt, style, num_images, strength,
+            num_inference_steps, guidance_scale, seed, scheduler, preset, profile,
+            adapter=adapter
+        )
+    
+    def refine_image(self, image, prompt, negative_prompt="", strength=0.25, **kwargs):
+        """
+        Low-strength img2img pass to polish a result without regenerating it
+        
+        Args:
+            image: PIL Image to refine
+            prompt: Prompt the image was generated with
+            negative_prompt: Things to avoid
+            strength: Fraction of the schedule to re-run (default 0.25)
+            **kwargs: Passed through to img2img()
+            
+        Returns:
+            Refined PIL Image
+        """
+        return self.img2img(image, prompt, negative_prompt=negative_prompt, strength=strength, **kwargs)[0]
+    
+    def inpaint(
+        self,
+        image,
+        mask,
+        prompt,
+        negative_prompt="",
+        strength=1.0,
+        style=None,
+        num_images=1,
+        num_inference_steps=None,
+        guidance_scale=7.5,
+        seed=None,
+        scheduler=None,
+        preset=None,
+        profile=None,
+        adapter=None
+    ):
+        """
+        Repaint the masked region of an image
+        
+        Args:
+            image: Source PIL Image
+            mask: PIL Image, white where the image should be repainted
+            prompt: Description of what should fill the masked region
+            negative_prompt: Things to avoid
+            strength: 0-1; 1.0 fully repaints the masked region
+            style: Generation style; None uses the prompt as-is
+            num_images: Number of images to generate
+            num_inference_steps: Full schedule length
+            guidance_scale: How closely to follow prompt
+            seed: Base seed (image k uses seed + k)
+            scheduler: Registry name from schedulers.SCHEDULERS
+            preset: 'fast', 'balanced' or 'quality'
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            adapter: LoRA adapter(s), as in generate_images
+            
+        Returns:
+            List of PIL Images
+        """
+        image = self._fit_to_latent_grid(image)
+        mask = mask.convert("L").crop((0, 0) + image.size)
+        width, height = image.size
+        return self._run_derived(
+            "inpaint", "inpaint",
+            {"image": image, "mask_image": mask, "height": height, "width": width},
+            prompt, negative_prompt, style, num_images, strength,
+            num_inference_steps, guidance_scale, seed, scheduler, preset, profile,
+            adapter=adapter
+        )
+    
+    def inpaint_watermark(self, image, prompt="clean background, seamless", **kwargs):
+        """
+        Remove the watermark corner by inpainting it with the diffusion model
+        
+        Args:
+            image: PIL Image carrying the watermark added by add_watermark()
+            prompt: What the repainted region should contain
+            **kwargs: Passed through to inpaint()
+            
+        Returns:
+            PIL Image with the watermark region repainted
+        """
+        # Our own watermark has a known box; pad it slightly so the seam is repainted too
+        left, top, right, bottom = self.watermark.box(image.size)
+        mask = Image.new("L", image.size, 0)
+        mask.paste(255, (max(0, left - 4), max(0, top - 4), min(image.size[0], right + 4), min(image.size[1], bottom + 4)))
+        result = self.inpaint(image, mask, prompt, **kwargs)[0]
+        
+        # Paste back only the masked region so the rest stays bit-exact
+        if result.size != image.size:
+            merged = image.convert("RGB").copy()
+            merged.paste(result, (0, 0), mask.crop((0, 0) + result.size))
+            return merged
+        return Image.composite(result, image.convert("RGB"), mask)
+    
+    @staticmethod
+    def _draft_dimension(value, scale):
+        """Scale a dimension for drafting, keeping it a multiple of 8"""
+        return max(64, int(value * scale) // 8 * 8)
+    
+    def generate_drafts(
+        self,
+        prompt,
+        negative_prompt="",
+        num_images=4,
+        style="realistic",
+        guidance_scale=7.5,
+        height=512,
+        width=512,
+        seed=None,
+        seeds=None,
+        draft_scale=DRAFT_SCALE,
+        draft_steps=DRAFT_STEPS,
+        draft_scheduler="dpmpp_2m_karras",
+        final_steps=None,
+        final_scheduler=None,
+        final_preset=None,
+        profile=None,
+        adapter=None
+    ):
+        """
+        First stage of draft-then-refine: cheap low-step, low-resolution drafts
+        
+        Draft latents are kept so the picked draft can be refined by a latent
+        upscale plus img2img pass (refine_draft) instead of a full regeneration.
+        
+        Args:
+            prompt: Text description of desired image
+            negative_prompt: Things to avoid in generation
+            num_images: Number of drafts
+            style: Generation style
+            guidance_scale: How closely to follow prompt
+            height: Final image height (drafts use height * draft_scale)
+            width: Final image width (drafts use width * draft_scale)
+            seed: Base seed (draft k uses seed + k)
+            seeds: Explicit per-draft seeds
+            draft_scale: Draft resolution relative to the final size
+            draft_steps: Denoising steps per draft
+            draft_scheduler: Scheduler used for drafts
+            final_steps: Step count used by refine_draft (None = scheduler's recommendation)
+            final_scheduler: Scheduler used by refine_draft
+            final_preset: Preset used by refine_draft
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            adapter: LoRA adapter(s), as in generate_images (refine_draft reuses them)
+            
+        Returns:
+            Dict with 'images' (draft previews), 'latents' (CPU tensor), 'seeds'
+            and 'params' (everything refine_draft needs)
+        """
+        self.set_scheduler(draft_scheduler)
+        adapter = self.adapters.activate(adapter)
+        enhanced_prompt = self.enhance_prompt(prompt, style)
+        full_negative = self.build_negative_prompt(negative_prompt)
+        seeds = self.make_seeds(num_images, seed, seeds)
+        draft_height = self._draft_dimension(height, draft_scale)
+        draft_width = self._draft_dimension(width, draft_scale)
+        
+        start = time.perf_counter()
+        with self.profiler.profile("generate_drafts", force=profile):
+            latents = self.pipe(
+                prompt=enhanced_prompt,
+                negative_prompt=full_negative,
+                num_images_per_prompt=num_images,
+                num_inference_steps=draft_steps,
+                guidance_scale=guidance_scale,
+                height=draft_height,
+                width=draft_width,
+                generator=[torch.Generator(device=self.device).manual_seed(s) for s in seeds],
+                output_type="latent"
+            ).images
+            
+            with torch.no_grad():
+                decoded = self.pipe.vae.decode(latents / self.pipe.vae.config.scaling_factor, return_dict=False)[0]
+            images = self.pipe.image_processor.postprocess(decoded, output_type="pil")
+        
+        log_event(
+            logger, "drafts.done",
+            num_images=len(images),
+            steps=draft_steps,
+            size=f"{draft_width}x{draft_height}",
+            duration_s=round(time.perf_counter() - start, 3)
+        )
+        
+        return {
+            "images": images,
+            "latents": latents.detach().to("cpu"),
+            "seeds": seeds,
+            "params": {
+                "prompt": prompt,
+                "negative_prompt": negative_prompt,
+                "style": style,
+                "guidance_scale": guidance_scale,
+                "height": height,
+                "width": width,
+                "draft_steps": draft_steps,
+                "draft_size": f"{draft_width}x{draft_height}",
+                "num_inference_steps": final_steps,
+                "scheduler": final_scheduler,
+                "preset": final_preset,
+                "adapter": dict(adapter) or None,
+            }
+        }
+    
+    def refine_draft(self, drafts, index, strength=0.55, profile=None):
+        """
+        Second stage of draft-then-refine: upscale one draft's latents and refine it
+        
+        Args:
+            drafts: Dict returned by generate_drafts() (or self.last_drafts)
+            index: Which draft to refine
+            strength: Fraction of the full schedule re-run on the upscaled latents
+            profile: True/False forces profiling on/off, None follows the profiler's sampling
+            
+        Returns:
+            Full-resolution PIL Image
+        """
+        params = drafts["params"]
+        scheduler, num_inference_steps = resolve_settings(
+            params.get("preset"), params.get("scheduler"), params.get("num_inference_steps")
+        )
+        self.set_scheduler(scheduler)
+        self.adapters.activate(params.get("adapter"))
+        pipe = self.get_pipeline("img2img")
+        
+        # Latent upscale: no VAE decode/encode round trip before the refine pass
+        latents = drafts["latents"][index:index + 1].to(self.device, dtype=self.pipe.unet.dtype)
+        latents = torch.nn.functional.interpolate(
+            latents,
+            size=(params["height"] // 8, params["width"] // 8),
+            mode="bicubic",
+            align_corners=False
+        )
+        
+        seed = drafts["seeds"][index]
+        enhanced_prompt = self.enhance_prompt(params["prompt"], params["style"])
+        negative_prompt = self.build_negative_prompt(params["negative_prompt"])
+        
+        start = time.perf_counter()
+        with self.profiler.profile("refine_draft", force=profile):
+            image = pipe(
+                prompt=enhanced_prompt,
+                negative_prompt=negative_prompt,
+                image=latents,
+                strength=strength,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=params["guidance_scale"],
+                generator=torch.Generator(device=self.device).manual_seed(seed)
+            ).images[0]
+        duration = time.perf_counter() - start
+        
+        log_event(
+            logger, "refine_draft.done",
+            index=index,
+            scheduler=scheduler,
+            effective_steps=int(num_inference_steps * strength),
+            size=f"{params['width']}x{params['height']}",
+            duration_s=round(duration, 3)
+        )
+        
+        self.last_generation_params = {
+            "mode": "draft_refine",
+            "prompt": params["prompt"],
+            "enhanced_prompt": enhanced_prompt,
+            "negative_prompt": negative_prompt,
+            "style": params["style"],
+            "seed": seed,
+            "seeds": [seed],
+            "scheduler": scheduler,
+            "num_inference_steps": num_inference_steps,
+            "strength": strength,
+            "guidance_scale": params["guidance_scale"],
+            "width": params["width"],
+            "height": params["height"],
+            "draft_steps": params["draft_steps"],
+            "draft_size": params["draft_size"],
+            "num_images": 1,
+            "generate_s": round(duration, 3)
+        }
+        return image
+    
+    def add_watermark(self, image):
+        """
+        Add AI-generated watermark to image
+        
+        The overlay is rendered once per image size by self.watermark and
+        alpha-composited, so the background box is genuinely semi-transparent.
+        
+        Returns:
+            New watermarked RGB image (the input is left untouched)
+        """
+        return self.watermark.apply(image)
+    
+    def save_images(
+        self,
+        images,
+        prompt,
+        output_dir="generated_images",
+        add_watermark=True,
+        image_format="png",
+        encode_options=None,
+        metadata_sidecar=False,
+        generation_params=None,
+        metadata_db=True,
+        naming="uuid",
+        shard=False
+    ):
+        """
+        Save generated images with metadata
+        
+        Args:
+            images: List of PIL Images
+            prompt: Original prompt
+            output_dir: Directory to save images
+            add_watermark: Whether to add AI watermark
+            image_format: Encoding preset from image_encoding.ENCODING_PRESETS
+                          ('png', 'png_fast', 'png_small', 'webp', 'webp_lossless', 'jpeg', 'avif')
+            encode_options: Overrides for the preset's Pillow save() options (e.g. {"quality": 85})
+            metadata_sidecar: Also write a legacy *_metadata.json next to each image
+            generation_params: Parameters recorded with each image (style, seed, steps, ...);
+                               None uses those of the last generate_images call
+            metadata_db: Record metadata in the output directory's metadata.db
+            naming: 'uuid' (timestamp + random ID), 'hash' (content hash, identical images
+                    share a file) or 'timestamp' (legacy, not safe for concurrent writers)
+            shard: Use a sharded layout (<output_dir>/ab/cd/<name>) for very large directories
+            
+        Returns:
+            List of saved file paths
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        start = time.perf_counter()
+        encoder = ImageEncoder(image_format, **(encode_options or {}))
+        
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        params = generation_params if generation_params is not None else (self.last_generation_params or {})
+        saved_paths = []
+        records = []
+        
+        # Add watermark if requested (one vectorized blend per image size)
+        if add_watermark:
+            images = self.watermark.apply_batch(images)
+        
+        for i, image in enumerate(images):
+            image_start = time.perf_counter()
+            
+            # Generate a collision-safe filename
+            filepath = build_output_path(
+                output_dir,
+                encoder.extension,
+                naming=naming,
+                shard=shard,
+                image=image,
+                index=i + 1
+            )
+            filename = os.path.basename(filepath)
+            
+            metadata = dict(params)
+            if params.get("seeds") and i < len(params["seeds"]):
+                metadata["seed"] = params["seeds"][i]
+            metadata.update({
+                "prompt": prompt,
+                "timestamp": timestamp,
+                "created_at": now.isoformat(),
+                "filename": filename,
+                "model": self.model_id,
+                "image_format": encoder.preset,
+                # Removing a watermark inverts the overlay; only valid if one was blended in
+                "watermarked": bool(add_watermark)
+            })
+            
+            # Save image with metadata embedded (PNG tEXt / EXIF); write-then-rename
+            # so concurrent sessions and readers never see a partial file
+            atomic_write_bytes(filepath, encoder.encode(image, metadata))
+            saved_paths.append(filepath)
+            
+            metadata["path"] = filepath
+            metadata["save_s"] = round(time.perf_counter() - image_start, 4)
+            records.append(metadata)
+            
+            if metadata_sidecar:
+                metadata_file = os.path.splitext(filepath)[0] + "_metadata.json"
+                with open(metadata_file, "w") as f:
+                    json.dump(metadata, f, indent=2)
+            
+            log_event(logger, "save.image", level=logging.DEBUG, path=filepath)
+        
+        # One transaction for the whole call
+        if metadata_db:
+            self.get_metadata_store(output_dir).add_many(records)
+        
+        log_event(
+            logger, "save.done",
+            num_images=len(saved_paths),
+            format=encoder.preset,
+            output_dir=output_dir,
+            duration_s=round(time.perf_counter() - start, 3)
+        )
+        
+        return saved_paths
+    
+    def get_metadata_store(self, output_dir="generated_images"):
+        """
+        Get the (cached) metadata store for an output directory
+        
+        Args:
+            output_dir: Directory images are saved to
+            
+        Returns:
+            MetadataStore
+        """
+        key = os.path.abspath(output_dir)
+        if key not in self._metadata_stores:
+            self._metadata_stores[key] = MetadataStore(output_dir)
+        return self._metadata_stores[key]
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Metadata Store Module
+Handles the per-output-directory SQLite database of generation metadata
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+DB_FILENAME = "metadata.db"
+
+# Columns promoted out of the params JSON so they can be filtered and indexed
+COLUMNS = [
+    "path", "filename", "prompt", "negative_prompt", "style", "model", "seed",
+    "num_inference_steps", "guidance_scale", "width", "height", "image_format",
+    "generate_s", "save_s", "created_at",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    prompt TEXT,
+    negative_prompt TEXT,
+    style TEXT,
+    model TEXT,
+    seed INTEGER,
+    num_inference_steps INTEGER,
+    guidance_scale REAL,
+    width INTEGER,
+    height INTEGER,
+    image_format TEXT,
+    generate_s REAL,
+    save_s REAL,
+    created_at TEXT,
+    params TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_created_at ON images (created_at);
+CREATE INDEX IF NOT EXISTS idx_images_style ON images (style);
+"""
+
+
+class MetadataStore:
+    """Bulk-write generation metadata to one SQLite database per output directory"""
+
+    def __init__(self, output_dir, filename=DB_FILENAME):
+        """
+        Open (or create) the store
+
+        Args:
+            output_dir: Directory the images are saved to
+            filename: Database filename inside output_dir
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.db_path = os.path.join(output_dir, filename)
+
+        self._lock = threading.Lock()
+        # Generous busy timeout: parallel batch workers may share one output directory
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(record):
+        """Split a metadata dict into column values plus the full params JSON"""
+        values = [record.get(column) for column in COLUMNS]
+        return values + [json.dumps(record, default=str)]
+
+    def add_many(self, records):
+        """
+        Insert (or replace) metadata for several images in one transaction
+
+        Args:
+            records: Iterable of dicts; must contain 'path', other COLUMNS are optional
+        """
+        rows = [self._row(record) for record in records]
+        if not rows:
+            return
+
+        placeholders = ", ".join("?" for _ in range(len(COLUMNS) + 1))
+        sql = f"INSERT OR REPLACE INTO images ({', '.join(COLUMNS)}, params) VALUES ({placeholders})"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def add(self, record):
+        """Insert (or replace) metadata for one image"""
+        self.add_many([record])
+
+    def get(self, path):
+        """
+        Look up one image by path
+
+        Returns:
+            Metadata dict, or None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT params FROM images WHERE path = ?", (path,)).fetchone()
+        return json.loads(row["params"]) if row else None
+
+    def query(self, prompt_contains=None, style=None, model=None, limit=None):
+        """
+        Query stored metadata, newest first
+
+        Args:
+            prompt_contains: Substring the prompt must contain
+            style: Exact style
+            model: Exact model ID
+            limit: Maximum rows
+
+        Returns:
+            List of metadata dicts
+        """
+        clauses, args = [], []
+        if prompt_contains:
+            clauses.append("prompt LIKE ?")
+            args.append(f"%{prompt_contains}%")
+        if style:
+            clauses.append("style = ?")
+            args.append(style)
+        if model:
+            clauses.append("model = ?")
+            args.append(model)
+
+        sql = "SELECT params FROM images"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [json.loads(row["params"]) for row in rows]
+
+    def count(self):
+        """Number of stored images"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def import_sidecars(self, directory=None, delete=False):
+        """
+        Import legacy *_metadata.json files into the store
+
+        Args:
+            directory: Directory to scan recursively (default: the store's output_dir)
+            delete: Remove each JSON file once it has been imported
+
+        Returns:
+            Number of imported records
+        """
+        directory = directory or self.output_dir
+        records, imported_files = [], []
+
+        pattern = os.path.join(directory, "**", "*_metadata.json")
+        for metadata_file in glob.glob(pattern, recursive=True):
+            try:
+                with open(metadata_file, "r") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            stem = metadata_file[:-len("_metadata.json")]
+            filename = record.get("filename") or os.path.basename(stem) + ".png"
+            record.setdefault("filename", filename)
+            record["path"] = os.path.join(os.path.dirname(metadata_file), filename)
+            if "created_at" not in record and record.get("timestamp"):
+                try:
+                    record["created_at"] = datetime.strptime(record["timestamp"], "%Y%m%d_%H%M%S").isoformat()
+                except ValueError:
+                    pass
+
+            records.append(record)
+            imported_files.append(metadata_file)
+
+        self.add_many(records)
+
+        if delete:
+            for metadata_file in imported_files:
+                os.remove(metadata_file)
+
+        return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation metadata store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="Import legacy *_metadata.json files")
+    migrate.add_argument("output_dir", help="Output directory to migrate")
+    migrate.add_argument("--delete", action="store_true", help="Delete JSON files after import")
+
+    query = subparsers.add_parser("query", help="Print stored metadata as JSON lines")
+    query.add_argument("output_dir")
+    query.add_argument("--prompt", default=None, help="Prompt substring")
+    query.add_argument("--style", default=None)
+    query.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+
+    with MetadataStore(args.output_dir) as store:
+        if args.command == "migrate":
+            imported = store.import_sidecars(delete=args.delete)
+            print(f"Imported {imported} metadata file(s) into {store.db_path}")
+        else:
+            for record in store.query(prompt_contains=args.prompt, style=args.style, limit=args.limit):
+                print(json.dumps(record, default=str))
+
+
+if __name__ == "__main__":
+    main()
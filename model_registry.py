@@ -0,0 +1,337 @@
+"""
+Model Registry Module
+Handles keeping several checkpoints resident while sharing identical components between them
+"""
+
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from diffusers import StableDiffusionPipeline
+
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("registry")
+
+# Weight-bearing pipeline components worth deduplicating
+SHARED_COMPONENTS = ("unet", "vae", "text_encoder")
+
+
+def module_bytes(module):
+    """Memory held by a module's parameters and buffers"""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def has_adapters(module):
+    """Whether LoRA layers are injected into a module (its weights may be fused with them)"""
+    return bool(getattr(module, "peft_config", None))
+
+
+def structure_signature(module):
+    """Cheap hash of a module's class, tensor names, shapes and dtypes (no weights read)"""
+    digest = hashlib.blake2b(type(module).__name__.encode(), digest_size=16)
+    for name, tensor in module.state_dict().items():
+        digest.update(f"{name}:{tuple(tensor.shape)}:{tensor.dtype};".encode())
+    return digest.hexdigest()
+
+
+def content_fingerprint(module):
+    """
+    Hash of every weight of a module
+
+    Two components with the same fingerprint are interchangeable. Tensors
+    are hashed in name order as raw bytes, copied to the CPU one at a time.
+    """
+    digest = hashlib.blake2b(structure_signature(module).encode(), digest_size=16)
+    with torch.no_grad():
+        for name, tensor in sorted(module.state_dict().items()):
+            data = tensor.detach().to("cpu").contiguous().reshape(-1)
+            digest.update(data.view(torch.uint8).numpy())
+    return digest.hexdigest()
+
+
+class _Component:
+    """One resident component, possibly used by several pipelines"""
+
+    def __init__(self, module, signature):
+        self.module = module
+        self.signature = signature
+        self.fingerprint = None
+        self.owners = set()
+        self.bytes = module_bytes(module)
+
+    def get_fingerprint(self):
+        if self.fingerprint is None:
+            self.fingerprint = content_fingerprint(self.module)
+        return self.fingerprint
+
+
+class ModelRegistry:
+    """
+    Resident Stable Diffusion pipelines with component-level deduplication
+
+    When a checkpoint is loaded, each of its UNet, VAE and text encoder is
+    compared with the components already resident. The structural signature
+    is checked first; weights are only hashed when the structures match.
+    Identical components are shared, so e.g. v1-4 and v1-5 hold one VAE and
+    one text encoder and differ only in their UNets. Once a checkpoint's
+    components are known, reloading it skips reading the shared ones from
+    disk. At most max_models pipelines stay resident (least recently used
+    evicted first); a component is freed when no resident pipeline uses it.
+    """
+
+    def __init__(self, max_models=None):
+        """
+        Initialize the registry
+
+        Args:
+            max_models: Pipelines kept resident; None reads IMAGE_GEN_MAX_RESIDENT_MODELS (default 2)
+        """
+        self.max_models = int(max_models or os.environ.get("IMAGE_GEN_MAX_RESIDENT_MODELS", 2))
+        self._lock = threading.RLock()
+        self._pipelines = OrderedDict()
+        self._components = {}
+        self._ids = itertools.count(1)
+        # (model_id, device, component name) -> component ID, kept after eviction
+        self._known = {}
+        # Keys being loaded -> Event set when the load ends
+        self._loading = {}
+
+    @staticmethod
+    def _key(model_id, device):
+        return (model_id, str(device))
+
+    def acquire(self, model_id, device, **load_kwargs):
+        """
+        Resident pipeline for a checkpoint, loading it if needed
+
+        The checkpoint is read and its new components hashed without holding
+        the registry lock, so other checkpoints stay available meanwhile;
+        concurrent requests for the same checkpoint wait for one load.
+
+        Args:
+            model_id: HuggingFace model identifier
+            device: Device the pipeline runs on
+            **load_kwargs: from_pretrained arguments (torch_dtype, token, ...)
+
+        Returns:
+            (pipeline, info) where info has 'resident' (no load was needed),
+            'shared' (component names reused from other checkpoints) and 'duration_s'
+        """
+        key = self._key(model_id, device)
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                if key in self._pipelines:
+                    self._pipelines.move_to_end(key)
+                    entry = self._pipelines[key]
+                    log_event(logger, "registry.hit", level=logging.DEBUG, model=model_id)
+                    return entry["pipe"], {"resident": True, "shared": [], "duration_s": 0.0}
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    # Components already known to be identical to resident ones are not read again
+                    preloaded = {}
+                    for name in SHARED_COMPONENTS:
+                        component_id = self._known.get(key + (name,))
+                        if component_id in self._components:
+                            preloaded[name] = component_id
+                    preloaded_modules = {name: self._components[cid].module for name, cid in preloaded.items()}
+                    break
+            # Another thread is loading this checkpoint; use its result (or retry if it failed)
+            loading.wait()
+
+        try:
+            pipe = StableDiffusionPipeline.from_pretrained(model_id, **load_kwargs, **preloaded_modules)
+            pipe, shared = self._register(key, pipe, device, preloaded)
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+        with self._lock:
+            resident = [model for model, _ in self._pipelines]
+        duration = time.perf_counter() - start
+        log_event(
+            logger, "registry.load",
+            model=model_id,
+            device=str(device),
+            shared=shared,
+            resident=resident,
+            duration_s=round(duration, 3)
+        )
+        return pipe, {"resident": False, "shared": shared, "duration_s": round(duration, 3)}
+
+    def _register(self, key, pipe, device, preloaded):
+        """
+        Deduplicate a freshly loaded pipeline's components and make it resident
+
+        Returns:
+            (pipeline, names of shared components)
+        """
+        components = dict(pipe.components)
+        fresh = {
+            name: (components[name], structure_signature(components[name]))
+            for name in SHARED_COMPONENTS
+            if components.get(name) is not None and name not in preloaded
+        }
+
+        # Outside the lock: hash the new modules (and resident candidates not
+        # hashed yet), and move those that won't be shared to the device
+        with self._lock:
+            candidates = {name: self._candidates(signature, device) for name, (_, signature) in fresh.items()}
+        fingerprints = {}
+        for name, (module, _) in fresh.items():
+            if candidates[name]:
+                fingerprints[name] = content_fingerprint(module)
+                if any(component.get_fingerprint() == fingerprints[name] for component in candidates[name]):
+                    continue
+            module.to(device)
+
+        with self._lock:
+            component_ids, reused, matched = {}, [], []
+            for name in SHARED_COMPONENTS:
+                module = components.get(name)
+                if module is None:
+                    continue
+                component_id = preloaded.get(name)
+                if component_id in self._components:
+                    reused.append(name)
+                else:
+                    # Not preloaded, or its component was evicted while this one loaded
+                    signature = fresh[name][1] if name in fresh else structure_signature(module)
+                    component_id, fingerprint = self._match(module, signature, device, fingerprints.get(name))
+                    if component_id is None:
+                        component_id = next(self._ids)
+                        component = _Component(module.to(device), signature)
+                        component.fingerprint = fingerprint
+                        self._components[component_id] = component
+                    else:
+                        matched.append(name)
+                component = self._components[component_id]
+                component.owners.add(key)
+                components[name] = component.module
+                component_ids[name] = component_id
+                self._known[key + (name,)] = component_id
+
+            if matched:
+                # Rebuild around the shared modules so the freshly read duplicates can be freed
+                components["safety_checker"] = None
+                pipe = StableDiffusionPipeline(**components, requires_safety_checker=False)
+            # Only the small remaining modules move here; the weights are in place already
+            pipe = pipe.to(device)
+
+            self._pipelines[key] = {
+                "pipe": pipe,
+                "components": component_ids,
+                "scheduler_config": pipe.scheduler.config,
+            }
+            while len(self._pipelines) > self.max_models:
+                self._evict(next(iter(self._pipelines)))
+        return pipe, sorted(reused + matched)
+
+    def _candidates(self, signature, device):
+        """Resident components a module with this signature may be identical to (lock held)"""
+        # Components carrying LoRA layers no longer hold the checkpoint's pristine weights
+        return [
+            component for component in self._components.values()
+            if component.signature == signature
+            and not has_adapters(component.module)
+            and self._device_of(component.module) == self._normalize(device)
+        ]
+
+    def _match(self, module, signature, device, fingerprint=None):
+        """
+        ID of a resident component with identical weights on the same device (lock held)
+
+        Fingerprints are normally computed before the lock is taken; only
+        components that became resident in the meantime are hashed here.
+
+        Returns:
+            (component ID or None, the module's fingerprint or None)
+        """
+        candidates = self._candidates(signature, device)
+        if not candidates:
+            return None, fingerprint
+        if fingerprint is None:
+            fingerprint = content_fingerprint(module)
+        for component_id, component in self._components.items():
+            if component in candidates and component.get_fingerprint() == fingerprint:
+                return component_id, fingerprint
+        return None, fingerprint
+
+    @staticmethod
+    def _normalize(device):
+        """torch.device with an explicit index, so 'cuda' and 'cuda:0' compare equal"""
+        device = torch.device(device)
+        if device.type == "cuda" and device.index is None:
+            return torch.device("cuda", torch.cuda.current_device())
+        return device
+
+    def _device_of(self, module):
+        parameter = next(module.parameters(), None)
+        return self._normalize(parameter.device if parameter is not None else "cpu")
+
+    def is_shared(self, model_id, device):
+        """Whether a resident pipeline uses any component together with another pipeline"""
+        with self._lock:
+            entry = self._pipelines.get(self._key(model_id, device))
+            if entry is None:
+                return False
+            return any(len(self._components[component_id].owners) > 1 for component_id in entry["components"].values())
+
+    def scheduler_config(self, model_id, device):
+        """The checkpoint's own scheduler config (pipelines may have swapped schedulers since)"""
+        with self._lock:
+            return self._pipelines[self._key(model_id, device)]["scheduler_config"]
+
+    def _evict(self, key):
+        """Drop a pipeline and free components nothing else uses (lock held)"""
+        entry = self._pipelines.pop(key)
+        freed = []
+        for name, component_id in entry["components"].items():
+            component = self._components[component_id]
+            component.owners.discard(key)
+            if not component.owners:
+                del self._components[component_id]
+                freed.append(name)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        log_event(logger, "registry.evict", model=key[0], freed=freed)
+
+    def evict(self, model_id, device):
+        """Drop a resident pipeline (generators holding it keep working until they reload)"""
+        with self._lock:
+            key = self._key(model_id, device)
+            if key in self._pipelines:
+                self._evict(key)
+
+    def resident_models(self):
+        """Model IDs currently resident, least recently used first"""
+        with self._lock:
+            return [model_id for model_id, _ in self._pipelines]
+
+    def memory_report(self):
+        """
+        Bytes held by resident components vs. what separate pipelines would hold
+
+        Returns:
+            Dict with 'resident_bytes', 'unshared_bytes', 'saved_bytes' and
+            'models' (model ID -> {component name: component ID})
+        """
+        with self._lock:
+            resident = sum(component.bytes for component in self._components.values())
+            unshared = sum(component.bytes * len(component.owners) for component in self._components.values())
+            models = {key[0]: dict(entry["components"]) for key, entry in self._pipelines.items()}
+        return {
+            "resident_bytes": resident,
+            "unshared_bytes": unshared,
+            "saved_bytes": unshared - resident,
+            "models": models,
+        }
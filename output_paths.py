@@ -0,0 +1,97 @@
+"""
+Output Paths Module
+Handles collision-safe file naming, sharded directory layout and atomic writes
+"""
+
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+
+NAMING_SCHEMES = ("uuid", "hash", "timestamp")
+
+
+def content_hash(image, length=32):
+    """
+    Hash an image's pixel content
+
+    Args:
+        image: PIL Image
+        length: Number of hex characters to keep
+
+    Returns:
+        Hex digest prefix; identical images always get the same value
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()[:length]
+
+
+def build_output_path(output_dir, extension, naming="uuid", shard=False, image=None, index=1, prefix="generated"):
+    """
+    Build a collision-safe output path
+
+    Args:
+        output_dir: Base output directory
+        extension: File extension including the dot (e.g. '.png')
+        naming: 'uuid' (timestamp + random ID), 'hash' (content hash of `image`)
+                or 'timestamp' (legacy second-resolution name, not collision-safe)
+        shard: Nest files as <output_dir>/ab/cd/<name> so no directory grows unbounded
+        image: PIL Image, required for naming='hash'
+        index: Position within the batch (used by 'timestamp' naming)
+        prefix: Filename prefix for 'uuid' and 'timestamp' naming
+
+    Returns:
+        Full file path; its directory is created if needed
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if naming == "hash":
+        if image is None:
+            raise ValueError("naming='hash' requires the image")
+        key = content_hash(image)
+        stem = key
+    elif naming == "uuid":
+        key = uuid.uuid4().hex
+        stem = f"{prefix}_{timestamp}_{key[:12]}"
+    elif naming == "timestamp":
+        key = hashlib.md5(f"{timestamp}_{index}".encode()).hexdigest()
+        stem = f"{prefix}_{timestamp}_{index}"
+    else:
+        raise ValueError(f"Unknown naming scheme '{naming}'. Choose from: {', '.join(NAMING_SCHEMES)}")
+
+    directory = os.path.join(output_dir, key[:2], key[2:4]) if shard else output_dir
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, stem + extension)
+
+
+def atomic_write_bytes(path, data, fsync=False):
+    """
+    Write bytes to a temporary file in the same directory, then rename over `path`
+
+    Readers never observe a partially written file, and two writers racing on
+    the same path leave one complete file rather than an interleaved one.
+
+    Args:
+        path: Destination path
+        data: Bytes to write
+        fsync: Flush to disk before the rename (slower, survives power loss)
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
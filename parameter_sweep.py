@@ -0,0 +1,371 @@
+"""
+Parameter Sweep Module
+Handles grid sweeps over steps, guidance scale and seed with shared work
+"""
+
+import argparse
+import csv
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import torch
+from PIL import ImageDraw, ImageFont
+
+from image_processor import ImageProcessor
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("sweep")
+
+STEP_MODES = ("capture", "rerun")
+
+
+class ParameterSweep:
+    """Sweep num_inference_steps, guidance_scale and seed on a loaded ImageGenerator"""
+
+    def __init__(self, generator, prompt, negative_prompt="", style="realistic", height=512, width=512, scheduler=None):
+        """
+        Initialize the sweep
+
+        Args:
+            generator: Loaded ImageGenerator
+            prompt: Text prompt shared by every point
+            negative_prompt: User negative prompt (default negatives are added)
+            style: Generation style
+            height: Image height (multiples of 8)
+            width: Image width (multiples of 8)
+            scheduler: Registry name from schedulers.SCHEDULERS; None keeps the active one
+        """
+        self.generator = generator
+        if scheduler is not None:
+            generator.set_scheduler(scheduler)
+        self.pipe = generator.pipe
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.style = style
+        self.height = height
+        self.width = width
+
+        self._embeddings = None
+        # (model_output, timestep, sample, output) of the latest scheduler step while capturing
+        self._last_step = None
+        self._warned_capture = False
+        call_params = inspect.signature(self.pipe.__call__).parameters
+        self._has_step_end_callback = "callback_on_step_end" in call_params
+
+    def _encode(self):
+        """Encode the prompt once; every point of the grid reuses the embeddings"""
+        if self._embeddings is None:
+            enhanced_prompt = self.generator.enhance_prompt(self.prompt, self.style)
+            negative_prompt = self.generator.build_negative_prompt(self.negative_prompt)
+            start = time.perf_counter()
+            with torch.no_grad():
+                prompt_embeds, negative_embeds = self.pipe.encode_prompt(
+                    enhanced_prompt,
+                    self.generator.device,
+                    1,
+                    True,
+                    negative_prompt=negative_prompt
+                )
+            self._embeddings = (prompt_embeds, negative_embeds)
+            log_event(logger, "sweep.encode", duration_s=round(time.perf_counter() - start, 4))
+        return self._embeddings
+
+    def _decode(self, latents):
+        """Decode latents to PIL images"""
+        vae = self.pipe.vae
+        with torch.no_grad():
+            decoded = vae.decode(latents / vae.config.scaling_factor, return_dict=False)[0]
+        return self.pipe.image_processor.postprocess(decoded, output_type="pil")
+
+    @contextmanager
+    def _tracking_steps(self):
+        """Record the inputs and output of every scheduler step (for x0 estimates)"""
+        scheduler = self.pipe.scheduler
+        original = scheduler.step
+
+        def step(model_output, timestep, sample, *args, return_dict=True, **kwargs):
+            output = original(model_output, timestep, sample, *args, return_dict=True, **kwargs)
+            self._last_step = (model_output, timestep, sample, output)
+            return output if return_dict else output.to_tuple()
+
+        # Shadow the bound method on this instance only; deleting it restores the class's
+        scheduler.step = step
+        try:
+            yield
+        finally:
+            del scheduler.step
+            self._last_step = None
+
+    def _x0_estimate(self, latents):
+        """
+        Clean-latent estimate after the step that produced latents
+
+        Schedulers that report it (DDIM, Euler, LCM, ...) give
+        pred_original_sample; DPM-Solver++ and UniPC keep x0 predictions in
+        model_outputs. Otherwise x0 is computed from the step's model output
+        and alphas_cumprod. If none applies, the noisy latents are returned
+        and a warning is logged.
+        """
+        scheduler = self.pipe.scheduler
+        config = scheduler.config
+        if self._last_step is not None:
+            model_output, timestep, sample, output = self._last_step
+            x0 = getattr(output, "pred_original_sample", None)
+            if x0 is not None:
+                return x0
+
+            model_outputs = getattr(scheduler, "model_outputs", None)
+            keeps_x0 = str(config.get("algorithm_type", "")).startswith("dpmsolver++") or config.get("predict_x0")
+            if keeps_x0 and model_outputs and model_outputs[-1] is not None:
+                return model_outputs[-1]
+
+            alphas_cumprod = getattr(scheduler, "alphas_cumprod", None)
+            prediction_type = config.get("prediction_type", "epsilon")
+            if alphas_cumprod is not None and prediction_type in ("epsilon", "v_prediction", "sample"):
+                alpha = alphas_cumprod[int(timestep)].to(device=sample.device, dtype=sample.dtype)
+                if prediction_type == "epsilon":
+                    return (sample - (1 - alpha).sqrt() * model_output) / alpha.sqrt()
+                if prediction_type == "v_prediction":
+                    return alpha.sqrt() * sample - (1 - alpha).sqrt() * model_output
+                return model_output
+
+        if not self._warned_capture:
+            self._warned_capture = True
+            log_event(
+                logger, "sweep.capture_unsupported", level=logging.WARNING,
+                scheduler=type(scheduler).__name__,
+                detail="no x0 estimate available; captured previews show the noisy latents"
+            )
+        return latents
+
+    def _run_batch(self, seeds, num_inference_steps, guidance_scale, capture_steps=None):
+        """
+        One pipeline call for all seeds of a (steps, guidance) point
+
+        Args:
+            seeds: Seeds rendered side by side in the batch
+            num_inference_steps: Steps of this run
+            guidance_scale: CFG scale of this run
+            capture_steps: Step counts whose intermediate result should be decoded
+
+        Returns:
+            Dict mapping step count -> (images, elapsed_s)
+        """
+        prompt_embeds, negative_embeds = self._encode()
+        batch = len(seeds)
+        captured = {}
+        capture_steps = set(capture_steps or [])
+        decode_time = [0.0]
+        start = time.perf_counter()
+
+        def on_step(step_index, latents):
+            done = step_index + 1
+            if done in capture_steps and done != num_inference_steps:
+                # Decoding previews is sweep overhead, not part of the step cost
+                elapsed = time.perf_counter() - start - decode_time[0]
+                decode_start = time.perf_counter()
+                captured[done] = (self._decode(self._x0_estimate(latents)), elapsed)
+                decode_time[0] += time.perf_counter() - decode_start
+
+        kwargs = {}
+        if capture_steps:
+            if self._has_step_end_callback:
+                def callback_on_step_end(pipe, step_index, timestep, callback_kwargs):
+                    on_step(step_index, callback_kwargs["latents"])
+                    return callback_kwargs
+                kwargs["callback_on_step_end"] = callback_on_step_end
+            else:
+                kwargs["callback"] = lambda step_index, timestep, latents: on_step(step_index, latents)
+                kwargs["callback_steps"] = 1
+
+        with self._tracking_steps():
+            output = self.pipe(
+                prompt_embeds=prompt_embeds.repeat(batch, 1, 1),
+                negative_prompt_embeds=negative_embeds.repeat(batch, 1, 1),
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                height=self.height,
+                width=self.width,
+                generator=[torch.Generator(device=self.generator.device).manual_seed(s) for s in seeds],
+                **kwargs
+            )
+        captured[num_inference_steps] = (output.images, time.perf_counter() - start - decode_time[0])
+        return captured
+
+    def run(self, steps=(20, 30, 50), guidance_scales=(7.5,), seeds=(0,), step_mode="capture", max_batch_size=None):
+        """
+        Run the sweep
+
+        Points that share (steps, guidance) are batched across seeds. With
+        step_mode='capture', each guidance value needs a single run at the
+        largest step count; smaller step counts are decoded from that run's
+        intermediate x0 estimates (an approximation of a shorter schedule, and
+        their elapsed_s is the time at which that step was reached).
+        step_mode='rerun' renders every step count separately (exact, slower).
+
+        Args:
+            steps: num_inference_steps values
+            guidance_scales: guidance_scale values
+            seeds: Seeds
+            step_mode: 'capture' or 'rerun'
+            max_batch_size: Maximum seeds per pipeline call (None = all)
+
+        Returns:
+            List of result dicts (steps, guidance_scale, seed, mode, elapsed_s,
+            per_image_s, image), ordered by guidance, steps, seed
+        """
+        if step_mode not in STEP_MODES:
+            raise ValueError(f"Unknown step_mode '{step_mode}'. Choose from: {', '.join(STEP_MODES)}")
+
+        steps = sorted(set(int(s) for s in steps))
+        seeds = list(seeds)
+        batch_size = max_batch_size or len(seeds)
+        seed_chunks = [seeds[i:i + batch_size] for i in range(0, len(seeds), batch_size)]
+
+        runs = []
+        for guidance in guidance_scales:
+            if step_mode == "capture":
+                runs.append((guidance, max(steps), steps))
+            else:
+                runs.extend((guidance, s, [s]) for s in steps)
+
+        log_event(
+            logger, "sweep.start",
+            points=len(steps) * len(guidance_scales) * len(seeds),
+            pipeline_calls=len(runs) * len(seed_chunks),
+            step_mode=step_mode
+        )
+        sweep_start = time.perf_counter()
+
+        results = []
+        for guidance, run_steps, wanted_steps in runs:
+            for chunk in seed_chunks:
+                captured = self._run_batch(chunk, run_steps, guidance, capture_steps=wanted_steps)
+                for step_count in wanted_steps:
+                    images, elapsed = captured[step_count]
+                    for seed, image in zip(chunk, images):
+                        results.append({
+                            "steps": step_count,
+                            "guidance_scale": guidance,
+                            "seed": seed,
+                            "width": self.width,
+                            "height": self.height,
+                            "mode": "exact" if step_count == run_steps else "captured",
+                            "elapsed_s": round(elapsed, 4),
+                            "per_image_s": round(elapsed / len(chunk), 4),
+                            "image": image,
+                        })
+
+        results.sort(key=lambda r: (r["guidance_scale"], r["steps"], seeds.index(r["seed"])))
+        log_event(logger, "sweep.done", num_images=len(results), duration_s=round(time.perf_counter() - sweep_start, 3))
+        return results
+
+    @staticmethod
+    def contact_sheet(results, thumb_size=256):
+        """
+        Build a labelled contact sheet: one row per (guidance, steps), one column per seed
+
+        Args:
+            results: Output of run()
+            thumb_size: Longest side of each thumbnail
+
+        Returns:
+            PIL Image
+        """
+        thumbs = []
+        font = ImageFont.load_default()
+        for result in results:
+            thumb = result["image"].copy()
+            thumb.thumbnail((thumb_size, thumb_size))
+            draw = ImageDraw.Draw(thumb)
+            label = f"cfg {result['guidance_scale']} | {result['steps']} st | seed {result['seed']}"
+            draw.rectangle([0, 0, thumb.size[0], 14], fill=(0, 0, 0))
+            draw.text((3, 1), label, fill=(255, 255, 255), font=font)
+            thumbs.append(thumb)
+
+        cols = len({r["seed"] for r in results}) or 1
+        return ImageProcessor.make_grid(thumbs, cols)
+
+    @staticmethod
+    def save(results, output_dir="sweep_output", save_images=False):
+        """
+        Write the contact sheet and a CSV of timings
+
+        Args:
+            results: Output of run()
+            output_dir: Destination directory
+            save_images: Also write every point as its own PNG
+
+        Returns:
+            (contact_sheet_path, csv_path)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        stem = os.path.join(output_dir, f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        sheet_path = f"{stem}_contact_sheet.png"
+        ParameterSweep.contact_sheet(results).save(sheet_path)
+
+        fields = ["steps", "guidance_scale", "seed", "width", "height", "mode", "elapsed_s", "per_image_s", "path"]
+        csv_path = f"{stem}.csv"
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for result in results:
+                row = {key: result.get(key) for key in fields}
+                if save_images:
+                    row["path"] = f"{stem}_cfg{result['guidance_scale']}_st{result['steps']}_seed{result['seed']}.png"
+                    result["image"].save(row["path"])
+                writer.writerow(row)
+
+        log_event(logger, "sweep.saved", contact_sheet=sheet_path, csv=csv_path)
+        return sheet_path, csv_path
+
+
+def main():
+    from image_generator import ImageGenerator
+
+    parser = argparse.ArgumentParser(description="Sweep steps, guidance scale and seeds")
+    parser.add_argument("prompt")
+    parser.add_argument("--negative-prompt", default="")
+    parser.add_argument("--style", default="realistic")
+    parser.add_argument("--scheduler", default=None, help="Registry name from schedulers.SCHEDULERS")
+    parser.add_argument("--model", default="stabilityai/stable-diffusion-2-1")
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 20, 30, 50])
+    parser.add_argument("--guidance", type=float, nargs="+", default=[7.5])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2, 3])
+    parser.add_argument("--size", type=int, nargs=2, default=[512, 512], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--step-mode", choices=STEP_MODES, default="capture")
+    parser.add_argument("--max-batch-size", type=int, default=None)
+    parser.add_argument("--output", default="sweep_output")
+    parser.add_argument("--save-images", action="store_true")
+    args = parser.parse_args()
+
+    generator = ImageGenerator(model_id=args.model)
+    sweep = ParameterSweep(
+        generator,
+        args.prompt,
+        negative_prompt=args.negative_prompt,
+        style=args.style,
+        width=args.size[0],
+        height=args.size[1],
+        scheduler=args.scheduler
+    )
+    results = sweep.run(
+        steps=args.steps,
+        guidance_scales=args.guidance,
+        seeds=args.seeds,
+        step_mode=args.step_mode,
+        max_batch_size=args.max_batch_size
+    )
+    sheet_path, csv_path = ParameterSweep.save(results, args.output, save_images=args.save_images)
+    print(f"Contact sheet: {sheet_path}")
+    print(f"Timings: {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Profiling Module
+Handles opt-in, sampled profiling of image generation calls
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import torch
+
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("profiling")
+
+
+class GenerationProfiler:
+    """Wrap generation calls in torch.profiler and/or cProfile"""
+
+    def __init__(
+        self,
+        enabled=None,
+        sample_every=None,
+        output_dir="generated_images",
+        top_n=25,
+        use_torch=True,
+        use_cprofile=True
+    ):
+        """
+        Initialize the profiler
+
+        Args:
+            enabled: Turn profiling on; None reads IMAGE_GEN_PROFILE from the environment
+            sample_every: Profile 1 in N calls; None reads IMAGE_GEN_PROFILE_SAMPLE (default 1)
+            output_dir: Directory the trace and summary files are written to
+            top_n: Number of rows in the operator/function summaries
+            use_torch: Capture a torch.profiler trace (Chrome-trace JSON)
+            use_cprofile: Capture a cProfile report of the Python side
+        """
+        if enabled is None:
+            enabled = os.environ.get("IMAGE_GEN_PROFILE", "").lower() in ("1", "true", "yes", "on")
+        if sample_every is None:
+            sample_every = int(os.environ.get("IMAGE_GEN_PROFILE_SAMPLE", "1") or 1)
+
+        self.enabled = enabled
+        self.sample_every = max(1, int(sample_every))
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.use_torch = use_torch
+        self.use_cprofile = use_cprofile
+
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def should_profile(self, force=None):
+        """
+        Decide whether the current call is sampled
+
+        Args:
+            force: True/False overrides the sampling decision, None samples
+
+        Returns:
+            True if this call should be profiled
+        """
+        if force is not None:
+            return bool(force)
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            self._calls += 1
+            return (self._calls - 1) % self.sample_every == 0
+
+    @contextmanager
+    def profile(self, label, force=None, output_dir=None):
+        """
+        Profile the wrapped block if it is sampled
+
+        Args:
+            label: Name used in the output filenames (e.g. 'generate_images')
+            force: True/False overrides the sampling decision
+            output_dir: Overrides the profiler's output directory for this call
+
+        Yields:
+            Dict with 'profiled' (whether this call was sampled), filled with
+            the written file paths once the block exits
+        """
+        report = {"profiled": self.should_profile(force)}
+        if not report["profiled"]:
+            yield report
+            return
+
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        stem = os.path.join(
+            output_dir,
+            f"profile_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        )
+
+        torch_prof = None
+        if self.use_torch:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_prof = torch.profiler.profile(
+                activities=activities,
+                record_shapes=True,
+                profile_memory=True
+            )
+
+        py_prof = cProfile.Profile() if self.use_cprofile else None
+
+        if torch_prof is not None:
+            torch_prof.__enter__()
+        if py_prof is not None:
+            py_prof.enable()
+
+        try:
+            yield report
+        finally:
+            if py_prof is not None:
+                py_prof.disable()
+            if torch_prof is not None:
+                torch_prof.__exit__(None, None, None)
+
+            self._write_reports(stem, torch_prof, py_prof, report)
+
+    def _write_reports(self, stem, torch_prof, py_prof, report):
+        """Dump the Chrome trace and the top-N summaries next to the outputs"""
+        sections = []
+
+        if torch_prof is not None:
+            trace_path = f"{stem}_trace.json"
+            torch_prof.export_chrome_trace(trace_path)
+            report["trace"] = trace_path
+
+            sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+            sections.append("=== torch.profiler operators ===")
+            sections.append(torch_prof.key_averages().table(sort_by=sort_by, row_limit=self.top_n))
+
+        if py_prof is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(py_prof, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.top_n)
+            sections.append("=== cProfile (cumulative) ===")
+            sections.append(stream.getvalue())
+
+            stats_path = f"{stem}.prof"
+            py_prof.dump_stats(stats_path)
+            report["cprofile"] = stats_path
+
+        if sections:
+            summary_path = f"{stem}_summary.txt"
+            with open(summary_path, "w") as f:
+                f.write("\n".join(sections))
+            report["summary"] = summary_path
+
+        log_event(logger, "profile.saved", **report)
@@ -0,0 +1,143 @@
+"""
+Prompt Budget Module
+Handles CLIP token counting, trimming of low-priority modifiers and chunked encoding of long prompts
+"""
+
+import logging
+from functools import lru_cache
+
+import torch
+
+from prompt_utils import normalize_prompt, split_tokens
+from structured_logging import get_logger, log_event
+
+
+logger = get_logger("prompt_budget")
+
+LONG_PROMPT_MODES = ("truncate", "chunk")
+
+
+class PromptBudget:
+    """Keep prompts within the text encoder's token window"""
+
+    def __init__(self, tokenizer, max_tokens=None, cache_size=4096):
+        """
+        Initialize the budget
+
+        Args:
+            tokenizer: The pipeline's CLIP tokenizer
+            max_tokens: Content tokens per window; None uses the tokenizer's
+                        model_max_length minus the BOS/EOS tokens (75 for CLIP)
+            cache_size: Prompts whose token counts and trim results are cached
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens or tokenizer.model_max_length - 2
+
+        # Batch runs check the same prompts and modifiers over and over
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+        self.fit = lru_cache(maxsize=cache_size)(self._fit)
+
+    def _count(self, text):
+        """Number of content tokens in a text (no BOS/EOS, no truncation)"""
+        return len(self._token_ids(text))
+
+    def _token_ids(self, text):
+        return self.tokenizer(text, add_special_tokens=False, truncation=False)["input_ids"]
+
+    def fits(self, text):
+        """Whether a text fits in one window"""
+        return self.count(text) <= self.max_tokens
+
+    def _fit(self, prompt, *modifiers):
+        """
+        Join a prompt with optional modifiers, dropping modifiers that don't fit
+
+        The prompt's own tokens are never removed; modifiers are dropped from
+        the end (the last ones appended carry the least weight). If the prompt
+        alone is over budget a warning is logged: the pipeline will truncate
+        it unless it is encoded with encode_long_prompt().
+
+        Args:
+            prompt: Required text (the user's prompt)
+            *modifiers: Optional comma-separated modifier strings, highest priority first
+
+        Returns:
+            Normalized prompt string
+        """
+        base = normalize_prompt(prompt)
+        base_tokens = set(split_tokens(base))
+        optional = [token for token in split_tokens(", ".join(modifiers)) if token not in base_tokens]
+        optional = list(dict.fromkeys(optional))
+
+        kept = len(optional)
+        text = normalize_prompt(base, *optional)
+        while kept and not self.fits(text):
+            kept -= 1
+            text = normalize_prompt(base, *optional[:kept])
+
+        if kept < len(optional):
+            log_event(
+                logger, "prompt.trimmed", level=logging.DEBUG,
+                dropped=optional[kept:],
+                tokens=self.count(text),
+                max_tokens=self.max_tokens
+            )
+        if not self.fits(base):
+            log_event(
+                logger, "prompt.over_budget", level=logging.WARNING,
+                tokens=self.count(base),
+                max_tokens=self.max_tokens,
+                truncated_tokens=self.count(base) - self.max_tokens
+            )
+        return text
+
+    def num_chunks(self, text):
+        """Windows needed to encode a text without truncation"""
+        return max(1, -(-self.count(text) // self.max_tokens))
+
+    def _encode_chunks(self, text_encoder, text, num_chunks, device):
+        """Encode a text as num_chunks windows and concatenate them along the sequence axis"""
+        tokenizer = self.tokenizer
+        ids = self._token_ids(text)
+        window = self.max_tokens + 2
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        rows = []
+        for k in range(num_chunks):
+            piece = ids[k * self.max_tokens:(k + 1) * self.max_tokens]
+            row = [tokenizer.bos_token_id] + piece + [tokenizer.eos_token_id]
+            rows.append(row + [pad_id] * (window - len(row)))
+
+        with torch.no_grad():
+            embeds = text_encoder(torch.tensor(rows, device=device))[0]
+        # (num_chunks, window, dim) -> (1, num_chunks * window, dim)
+        return embeds.reshape(1, -1, embeds.shape[-1])
+
+    def encode_long_prompt(self, text_encoder, prompt, negative_prompt, device, dtype=None):
+        """
+        Encode prompts longer than one window without truncation
+
+        Each prompt is split into windows of max_tokens, every window is
+        encoded separately, and the embeddings are concatenated. The negative
+        prompt is padded to the same number of windows so classifier-free
+        guidance can batch both.
+
+        Args:
+            text_encoder: The pipeline's text encoder
+            prompt: Prompt text
+            negative_prompt: Negative prompt text
+            device: Torch device
+            dtype: Output dtype (None keeps the encoder's)
+
+        Returns:
+            (prompt_embeds, negative_prompt_embeds), each (1, windows * 77, dim)
+        """
+        num_chunks = max(self.num_chunks(prompt), self.num_chunks(negative_prompt))
+        prompt_embeds = self._encode_chunks(text_encoder, prompt, num_chunks, device)
+        negative_embeds = self._encode_chunks(text_encoder, negative_prompt, num_chunks, device)
+        if dtype is not None:
+            prompt_embeds = prompt_embeds.to(dtype)
+            negative_embeds = negative_embeds.to(dtype)
+
+        log_event(logger, "prompt.chunked", level=logging.DEBUG, windows=num_chunks)
+        return prompt_embeds, negative_embeds
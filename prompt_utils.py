@@ -1,161 +1,304 @@
-"""
-Prompt Utilities Module
-Handles prompt variations and enhancements
-"""
-
-import random
-import re
-
-
-class PromptVariator:
-    """Generate variations of prompts"""
-    
-    # Quality enhancers
-    QUALITY_TAGS = [
-        "high quality", "detailed", "4K", "8K", "ultra detailed",
-        "professional", "masterpiece", "best quality", "sharp focus"
-    ]
-    
-    # Style modifiers
-    STYLE_MODIFIERS = {
-        "realistic": ["photorealistic", "realistic", "professional photography", "DSLR"],
-        "artistic": ["artistic", "oil painting", "watercolor", "digital art", "concept art"],
-        "fantasy": ["fantasy art", "magical", "ethereal", "epic", "legendary"],
-        "cyberpunk": ["cyberpunk", "neon", "futuristic", "dystopian", "sci-fi"],
-        "anime": ["anime style", "manga", "japanese animation", "cel shaded"],
-        "cartoon": ["cartoon style", "animated", "vibrant colors", "illustration"]
-    }
-    
-    # Lighting modifiers
-    LIGHTING_MODIFIERS = [
-        "natural lighting", "golden hour", "sunset", "sunrise", "dramatic lighting",
-        "soft lighting", "studio lighting", "rim lighting", "backlit", "ambient light"
-    ]
-    
-    # Composition modifiers
-    COMPOSITION_MODIFIERS = [
-        "wide angle", "close-up", "macro", "panoramic", "bird's eye view",
-        "low angle", "dutch angle", "rule of thirds", "centered composition"
-    ]
-    
-    # Mood modifiers
-    MOOD_MODIFIERS = [
-        "peaceful", "dramatic", "mysterious", "vibrant", "serene", "energetic",
-        "melancholic", "joyful", "epic", "intimate", "grandiose"
-    ]
-    
-    @staticmethod
-    def generate_variations(prompt, num_variations=5, style=None):
-        """
-        Generate variations of a prompt
-        
-        Args:
-            prompt: Original prompt string
-            num_variations: Number of variations to generate
-            style: Optional style to emphasize
-            
-        Returns:
-            List of prompt variations
-        """
-        variations = []
-        base_prompt = prompt.strip()
-        
-        # Extract main subject (first part before comma if exists)
-        parts = base_prompt.split(',')
-        main_subject = parts[0].strip()
-        existing_modifiers = [p.strip() for p in parts[1:]] if len(parts) > 1 else []
-        
-        for i in range(num_variations):
-            variation_parts = [main_subject]
-            
-            # Add style modifiers if specified
-            if style and style in PromptVariator.STYLE_MODIFIERS:
-                style_mods = PromptVariator.STYLE_MODIFIERS[style]
-                variation_parts.append(random.choice(style_mods))
-            
-            # Add quality tags (50% chance)
-            if random.random() > 0.5:
-                variation_parts.append(random.choice(PromptVariator.QUALITY_TAGS))
-            
-            # Add lighting modifier (40% chance)
-            if random.random() > 0.6:
-                variation_parts.append(random.choice(PromptVariator.LIGHTING_MODIFIERS))
-            
-            # Add composition modifier (30% chance)
-            if random.random() > 0.7:
-                variation_parts.append(random.choice(PromptVariator.COMPOSITION_MODIFIERS))
-            
-            # Add mood modifier (30% chance)
-            if random.random() > 0.7:
-                variation_parts.append(random.choice(PromptVariator.MOOD_MODIFIERS))
-            
-            # Keep some existing modifiers (random selection)
-            if existing_modifiers:
-                keep_count = random.randint(0, min(2, len(existing_modifiers)))
-                kept = random.sample(existing_modifiers, keep_count)
-                variation_parts.extend(kept)
-            
-            variations.append(", ".join(variation_parts))
-        
-        return variations
-    
-    @staticmethod
-    def enhance_prompt(prompt, add_quality=True, add_lighting=True):
-        """
-        Enhance a prompt with quality and lighting modifiers
-        
-        Args:
-            prompt: Original prompt
-            add_quality: Add quality tags
-            add_lighting: Add lighting modifiers
-            
-        Returns:
-            Enhanced prompt
-        """
-        enhanced = prompt.strip()
-        
-        if add_quality and not any(tag in enhanced.lower() for tag in PromptVariator.QUALITY_TAGS):
-            enhanced += f", {random.choice(PromptVariator.QUALITY_TAGS)}"
-        
-        if add_lighting and not any(light in enhanced.lower() for light in PromptVariator.LIGHTING_MODIFIERS):
-            enhanced += f", {random.choice(PromptVariator.LIGHTING_MODIFIERS)}"
-        
-        return enhanced
-    
-    @staticmethod
-    def create_negative_prompt_variations(negative_prompt=""):
-        """
-        Generate variations of negative prompts
-        
-        Args:
-            negative_prompt: Original negative prompt
-            
-        Returns:
-            List of negative prompt variations
-        """
-        base_negatives = [
-            "blurry", "low quality", "distorted", "deformed", "ugly",
-            "bad anatomy", "bad proportions", "watermark", "text", "signature"
-        ]
-        
-        variations = []
-        
-        # Start with base if provided
-        if negative_prompt:
-            base_list = [n.strip() for n in negative_prompt.split(',')]
-        else:
-            base_list = []
-        
-        # Generate variations
-        for i in range(3):
-            variation = base_list.copy()
-            
-            # Add random negatives
-            add_count = random.randint(2, 4)
-            additional = random.sample(base_negatives, min(add_count, len(base_negatives)))
-            variation.extend(additional)
-            
-            variations.append(", ".join(variation))
-        
-        return variations
-
+"""
+Prompt Utilities Module
+Handles prompt variations and enhancements
+"""
+
+import functools
+import re
+import threading
+
+import numpy as np
+
+
+def split_tokens(text):
+    """
+    Split a comma-separated prompt into canonical tokens
+    
+    Whitespace is collapsed and tokens are lowercased (the CLIP tokenizer
+    lowercases anyway, so this never changes what the model sees).
+    
+    Args:
+        text: Prompt or negative prompt
+        
+    Returns:
+        List of non-empty tokens
+    """
+    tokens = []
+    for token in (text or "").split(","):
+        token = re.sub(r"\s+", " ", token).strip().lower()
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def normalize_prompt(*parts):
+    """
+    Join prompt fragments into one canonical prompt without repeated modifiers
+    
+    Token order is kept (earlier tokens carry more weight); a token that
+    already appeared is dropped.
+    
+    Args:
+        *parts: Prompt fragments, e.g. the user prompt and a style suffix
+        
+    Returns:
+        Normalized prompt string
+    """
+    seen = set()
+    tokens = []
+    for part in parts:
+        for token in split_tokens(part):
+            if token not in seen:
+                seen.add(token)
+                tokens.append(token)
+    return ", ".join(tokens)
+
+
+class _variator_method:
+    """
+    Method that also works when called on the class
+    
+    PromptVariator.generate_variations("a cat", 3) was a static call before
+    variators carried their own generator; such calls run on a shared,
+    unseeded default instance.
+    """
+    
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+    
+    def __get__(self, instance, owner):
+        if instance is None:
+            instance = owner.default()
+        return self.func.__get__(instance, owner)
+
+
+class PromptVariator:
+    """Generate variations of prompts from a seedable random generator"""
+    
+    _default = None
+    _default_lock = threading.Lock()
+    
+    # Quality enhancers
+    QUALITY_TAGS = [
+        "high quality", "detailed", "4K", "8K", "ultra detailed",
+        "professional", "masterpiece", "best quality", "sharp focus"
+    ]
+    
+    # Style modifiers
+    STYLE_MODIFIERS = {
+        "realistic": ["photorealistic", "realistic", "professional photography", "DSLR"],
+        "artistic": ["artistic", "oil painting", "watercolor", "digital art", "concept art"],
+        "fantasy": ["fantasy art", "magical", "ethereal", "epic", "legendary"],
+        "cyberpunk": ["cyberpunk", "neon", "futuristic", "dystopian", "sci-fi"],
+        "anime": ["anime style", "manga", "japanese animation", "cel shaded"],
+        "cartoon": ["cartoon style", "animated", "vibrant colors", "illustration"]
+    }
+    
+    # Lighting modifiers
+    LIGHTING_MODIFIERS = [
+        "natural lighting", "golden hour", "sunset", "sunrise", "dramatic lighting",
+        "soft lighting", "studio lighting", "rim lighting", "backlit", "ambient light"
+    ]
+    
+    # Composition modifiers
+    COMPOSITION_MODIFIERS = [
+        "wide angle", "close-up", "macro", "panoramic", "bird's eye view",
+        "low angle", "dutch angle", "rule of thirds", "centered composition"
+    ]
+    
+    # Mood modifiers
+    MOOD_MODIFIERS = [
+        "peaceful", "dramatic", "mysterious", "vibrant", "serene", "energetic",
+        "melancholic", "joyful", "epic", "intimate", "grandiose"
+    ]
+    
+    # Probability that a variation gets a modifier from each pool
+    MODIFIER_PROBABILITIES = (("quality", 0.5), ("lighting", 0.4), ("composition", 0.3), ("mood", 0.3))
+    
+    NEGATIVE_BASE = [
+        "blurry", "low quality", "distorted", "deformed", "ugly",
+        "bad anatomy", "bad proportions", "watermark", "text", "signature"
+    ]
+    
+    def __init__(self, seed=None):
+        """
+        Initialize the variator
+        
+        Args:
+            seed: Seed for this instance's own random generator; the same seed
+                  always yields the same variations (None = unpredictable)
+        """
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self._pools = {
+            "quality": np.array(split_tokens(", ".join(self.QUALITY_TAGS)), dtype=object),
+            "lighting": np.array(split_tokens(", ".join(self.LIGHTING_MODIFIERS)), dtype=object),
+            "composition": np.array(split_tokens(", ".join(self.COMPOSITION_MODIFIERS)), dtype=object),
+            "mood": np.array(split_tokens(", ".join(self.MOOD_MODIFIERS)), dtype=object),
+        }
+    
+    @classmethod
+    def default(cls):
+        """Shared unseeded instance behind class-level calls"""
+        with cls._default_lock:
+            if not isinstance(cls.__dict__.get("_default"), cls):
+                cls._default = cls()
+            return cls._default
+    
+    def _variation_columns(self, num_variations, style, existing_count):
+        """
+        Draw every random choice for a batch of variations at once
+        
+        Returns:
+            List of object arrays (one per modifier slot, None where a variation
+            skips the slot) and an (n, 2) index array of kept existing modifiers
+            (-1 = not kept)
+        """
+        n = num_variations
+        columns = []
+        
+        if style and style in self.STYLE_MODIFIERS:
+            style_pool = np.array(split_tokens(", ".join(self.STYLE_MODIFIERS[style])), dtype=object)
+            columns.append(style_pool[self.rng.integers(len(style_pool), size=n)])
+        
+        for name, probability in self.MODIFIER_PROBABILITIES:
+            pool = self._pools[name]
+            picked = pool[self.rng.integers(len(pool), size=n)]
+            picked[self.rng.random(n) >= probability] = None
+            columns.append(picked)
+        
+        # Keep 0-2 of the prompt's own modifiers: a random permutation prefix per row
+        kept = np.full((n, 2), -1)
+        if existing_count:
+            max_keep = min(2, existing_count)
+            order = self.rng.random((n, existing_count)).argsort(axis=1)[:, :max_keep]
+            keep_count = self.rng.integers(0, max_keep + 1, size=n)
+            mask = np.arange(max_keep) < keep_count[:, None]
+            kept[:, :max_keep] = np.where(mask, order, -1)
+        
+        return columns, kept
+    
+    @_variator_method
+    def generate_variations_bulk(self, prompt, num_variations=1000, style=None):
+        """
+        Generate many variations in one vectorized pass
+        
+        Args:
+            prompt: Original prompt string
+            num_variations: Number of variations to generate
+            style: Optional style to emphasize
+            
+        Returns:
+            List of normalized prompt variations (duplicates are possible)
+        """
+        # Extract main subject (first part before comma if exists)
+        tokens = split_tokens(prompt)
+        main_subject = tokens[0] if tokens else ""
+        existing_modifiers = tokens[1:]
+        
+        columns, kept = self._variation_columns(num_variations, style, len(existing_modifiers))
+        
+        variations = []
+        for row, parts in enumerate(zip(*columns) if columns else [()] * num_variations):
+            variation_parts = [main_subject]
+            variation_parts.extend(part for part in parts if part is not None)
+            variation_parts.extend(existing_modifiers[k] for k in kept[row] if k >= 0)
+            # Tokens are canonical already; only repeats need removing
+            variations.append(", ".join(dict.fromkeys(part for part in variation_parts if part)))
+        return variations
+    
+    @_variator_method
+    def iter_variations(self, prompt, style=None, limit=None, chunk_size=1024):
+        """
+        Lazily yield variations, drawing them chunk_size at a time
+        
+        Args:
+            prompt: Original prompt string
+            style: Optional style to emphasize
+            limit: Stop after this many variations (None = endless)
+            chunk_size: Variations drawn per vectorized pass
+            
+        Yields:
+            Prompt variations
+        """
+        produced = 0
+        while limit is None or produced < limit:
+            count = chunk_size if limit is None else min(chunk_size, limit - produced)
+            for variation in self.generate_variations_bulk(prompt, count, style):
+                yield variation
+            produced += count
+    
+    @_variator_method
+    def generate_variations(self, prompt, num_variations=5, style=None):
+        """
+        Generate variations of a prompt
+        
+        Args:
+            prompt: Original prompt string
+            num_variations: Number of variations to generate
+            style: Optional style to emphasize
+            
+        Returns:
+            List of prompt variations
+        """
+        return self.generate_variations_bulk(prompt, num_variations, style)
+    
+    @_variator_method
+    def enhance_prompt(self, prompt, add_quality=True, add_lighting=True):
+        """
+        Enhance a prompt with quality and lighting modifiers
+        
+        Args:
+            prompt: Original prompt
+            add_quality: Add quality tags
+            add_lighting: Add lighting modifiers
+            
+        Returns:
+            Enhanced prompt
+        """
+        enhanced = prompt.strip()
+        
+        if add_quality and not any(tag in enhanced.lower() for tag in PromptVariator.QUALITY_TAGS):
+            enhanced += f", {self.rng.choice(self.QUALITY_TAGS)}"
+        
+        if add_lighting and not any(light in enhanced.lower() for light in PromptVariator.LIGHTING_MODIFIERS):
+            enhanced += f", {self.rng.choice(self.LIGHTING_MODIFIERS)}"
+        
+        return normalize_prompt(enhanced)
+    
+    @_variator_method
+    def create_negative_prompt_variations(self, negative_prompt="", num_variations=3):
+        """
+        Generate variations of negative prompts
+        
+        Args:
+            negative_prompt: Original negative prompt
+            num_variations: Number of variations to generate
+            
+        Returns:
+            List of negative prompt variations
+        """
+        base_negatives = self.NEGATIVE_BASE
+        
+        variations = []
+        
+        # Start with base if provided
+        if negative_prompt:
+            base_list = [n.strip() for n in negative_prompt.split(',')]
+        else:
+            base_list = []
+        
+        # Generate variations
+        for i in range(num_variations):
+            variation = base_list.copy()
+            
+            # Add random negatives
+            add_count = int(self.rng.integers(2, 5))
+            additional = self.rng.choice(base_negatives, min(add_count, len(base_negatives)), replace=False)
+            variation.extend(additional)
+            
+            variations.append(normalize_prompt(*variation))
+        
+        return variations
+
@@ -0,0 +1,143 @@
+"""
+Scheduler Module
+Handles the registry of diffusion schedulers and the fast/balanced/quality presets
+"""
+
+import diffusers
+
+
+# Registry of selectable schedulers. `steps` is the recommended step count,
+# `requires_lcm` marks schedulers that only work with LCM-distilled weights.
+SCHEDULERS = {
+    "dpmpp_2m": {
+        "label": "DPM++ 2M",
+        "class": "DPMSolverMultistepScheduler",
+        "config": {"algorithm_type": "dpmsolver++", "solver_order": 2},
+        "steps": 25,
+    },
+    "dpmpp_2m_karras": {
+        "label": "DPM++ 2M Karras",
+        "class": "DPMSolverMultistepScheduler",
+        "config": {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True},
+        "steps": 20,
+    },
+    "euler_a": {
+        "label": "Euler a",
+        "class": "EulerAncestralDiscreteScheduler",
+        "config": {},
+        "steps": 30,
+    },
+    "unipc": {
+        "label": "UniPC",
+        "class": "UniPCMultistepScheduler",
+        "config": {},
+        "steps": 20,
+    },
+    "ddim": {
+        "label": "DDIM",
+        "class": "DDIMScheduler",
+        "config": {},
+        "steps": 50,
+    },
+    "lcm": {
+        "label": "LCM",
+        "class": "LCMScheduler",
+        "config": {},
+        "steps": 4,
+        "requires_lcm": True,
+    },
+}
+
+DEFAULT_SCHEDULER = "dpmpp_2m"
+
+# Speed presets exposed in app.py and batch configs
+PRESETS = {
+    "fast": {"scheduler": "dpmpp_2m_karras", "steps": 15},
+    "balanced": {"scheduler": "dpmpp_2m", "steps": 25},
+    "quality": {"scheduler": "dpmpp_2m_karras", "steps": 40},
+}
+
+
+def supports_lcm(model_id):
+    """Whether a model's weights are LCM-distilled (LCM sampling produces noise otherwise)"""
+    return "lcm" in (model_id or "").lower()
+
+
+def available_schedulers(model_id=None):
+    """
+    List scheduler names usable with a model
+
+    Args:
+        model_id: HuggingFace model identifier (used to decide LCM availability)
+
+    Returns:
+        List of registry names
+    """
+    names = []
+    for name, spec in SCHEDULERS.items():
+        if not hasattr(diffusers, spec["class"]):
+            continue
+        if spec.get("requires_lcm") and not supports_lcm(model_id):
+            continue
+        names.append(name)
+    return names
+
+
+def build_scheduler(name, base_config, model_id=None):
+    """
+    Instantiate a registered scheduler from the pipeline's scheduler config
+
+    Args:
+        name: Registry name
+        base_config: The loaded pipeline's scheduler.config
+        model_id: Checkpoint the scheduler is for; schedulers marked
+                  requires_lcm are refused unless supports_lcm(model_id)
+
+    Returns:
+        Scheduler instance
+    """
+    if name not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{name}'. Choose from: {', '.join(SCHEDULERS)}")
+
+    spec = SCHEDULERS[name]
+    if spec.get("requires_lcm") and not supports_lcm(model_id):
+        raise ValueError(
+            f"Scheduler '{name}' needs an LCM-distilled checkpoint and '{model_id}' is not one. "
+            f"Choose from: {', '.join(available_schedulers(model_id))}"
+        )
+    scheduler_class = getattr(diffusers, spec["class"], None)
+    if scheduler_class is None:
+        raise ValueError(f"Scheduler '{name}' needs a newer diffusers ({spec['class']} not found)")
+
+    return scheduler_class.from_config(base_config, **spec["config"])
+
+
+def resolve_settings(preset=None, scheduler=None, num_inference_steps=None):
+    """
+    Resolve the scheduler and step count for a request
+
+    Explicit values win over the preset; missing steps fall back to the
+    scheduler's recommended count.
+
+    Args:
+        preset: 'fast', 'balanced', 'quality' or None
+        scheduler: Registry name or None
+        num_inference_steps: Step count or None
+
+    Returns:
+        (scheduler_name, num_inference_steps)
+    """
+    if preset is not None:
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown preset '{preset}'. Choose from: {', '.join(PRESETS)}")
+        scheduler = scheduler or PRESETS[preset]["scheduler"]
+        if num_inference_steps is None:
+            num_inference_steps = PRESETS[preset]["steps"]
+
+    scheduler = scheduler or DEFAULT_SCHEDULER
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler '{scheduler}'. Choose from: {', '.join(SCHEDULERS)}")
+    if num_inference_steps is None:
+        num_inference_steps = SCHEDULERS[scheduler]["steps"]
+
+    return scheduler, num_inference_steps
@@ -0,0 +1,190 @@
+"""
+Structured Logging Module
+Handles levelled, JSON-capable, rate-limited logging with per-job correlation IDs
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+ROOT_LOGGER = "image_gen"
+
+_job_id = contextvars.ContextVar("image_gen_job_id", default=None)
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            payload["job_id"] = job_id
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable single-line format with the structured fields appended"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        job_id = getattr(record, "job_id", None)
+        if job_id:
+            line += f" job={job_id}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class CorrelationFilter(logging.Filter):
+    """Attach the current job ID to every record"""
+
+    def filter(self, record):
+        if not hasattr(record, "job_id"):
+            record.job_id = _job_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop repeats of the same event beyond `max_per_interval` per `interval` seconds
+
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, max_per_interval=20, interval=1.0):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.max_per_interval <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._windows.get(key, (now, 0))
+            if now - start >= self.interval:
+                start, count = now, 0
+            count += 1
+            self._windows[key] = (start, count)
+        return count <= self.max_per_interval
+
+
+def configure_logging(level=None, json_output=None, rate_limit=None, stream=None):
+    """
+    Configure the package logger; safe to call repeatedly
+
+    Args:
+        level: Log level name or number; None reads IMAGE_GEN_LOG_LEVEL (default INFO)
+        json_output: Emit JSON lines; None reads IMAGE_GEN_LOG_FORMAT == 'json'
+        rate_limit: Max repeats of one event per second; None reads IMAGE_GEN_LOG_RATE (default 20)
+        stream: Output stream (default stderr)
+
+    Returns:
+        The configured package logger
+    """
+    global _configured
+
+    if level is None:
+        level = os.environ.get("IMAGE_GEN_LOG_LEVEL", "INFO")
+    if json_output is None:
+        json_output = os.environ.get("IMAGE_GEN_LOG_FORMAT", "").lower() == "json"
+    if rate_limit is None:
+        rate_limit = int(os.environ.get("IMAGE_GEN_LOG_RATE", "20") or 0)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    with _configure_lock:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter() if json_output else TextFormatter())
+        handler.addFilter(CorrelationFilter())
+        if rate_limit:
+            handler.addFilter(RateLimitFilter(max_per_interval=rate_limit))
+
+        root.addHandler(handler)
+        root.setLevel(level if isinstance(level, int) else str(level).upper())
+        root.propagate = False
+        _configured = True
+
+    return root
+
+
+def get_logger(name):
+    """
+    Get a child of the package logger, configuring defaults on first use
+
+    Args:
+        name: Module or component name (e.g. 'generator', 'batch')
+    """
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """
+    Log a structured event
+
+    Args:
+        logger: Logger from get_logger()
+        event: Short dotted event name (e.g. 'generate.done')
+        level: Logging level
+        **fields: Structured key/value fields attached to the record
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def new_job_id():
+    """Return a short random correlation ID"""
+    return uuid.uuid4().hex[:12]
+
+
+def current_job_id():
+    """Return the correlation ID of the active job, if any"""
+    return _job_id.get()
+
+
+@contextmanager
+def job_context(job_id=None):
+    """
+    Bind a correlation ID to every log record emitted inside the block
+
+    Args:
+        job_id: ID to bind; None generates a new one
+
+    Yields:
+        The bound job ID
+    """
+    job_id = job_id or new_job_id()
+    token = _job_id.set(job_id)
+    try:
+        yield job_id
+    finally:
+        _job_id.reset(token)